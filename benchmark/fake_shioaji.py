@@ -0,0 +1,190 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import shioaji.constant as sc
+from shioaji.contracts import Future
+
+
+@dataclass
+class FakeTickFOPv1:
+    code: str
+    datetime: datetime
+    open: Decimal
+    underlying_price: Decimal
+    bid_side_total_vol: int
+    ask_side_total_vol: int
+    avg_price: Decimal
+    close: Decimal
+    high: Decimal
+    low: Decimal
+    amount: Decimal
+    total_amount: Decimal
+    volume: int
+    total_volume: int
+    tick_type: int
+    chg_type: int
+    price_chg: Decimal
+    pct_chg: Decimal
+    simtrade: bool = False
+
+
+@dataclass
+class FakeBidAskFOPv1:
+    code: str
+    datetime: datetime
+    bid_total_vol: int
+    ask_total_vol: int
+    bid_price: list[Decimal] = field(default_factory=list)
+    bid_volume: list[int] = field(default_factory=list)
+    diff_bid_vol: list[int] = field(default_factory=list)
+    ask_price: list[Decimal] = field(default_factory=list)
+    ask_volume: list[int] = field(default_factory=list)
+    diff_ask_vol: list[int] = field(default_factory=list)
+    first_derived_bid_price: Decimal = Decimal(0)
+    first_derived_ask_price: Decimal = Decimal(0)
+    first_derived_bid_vol: int = 0
+    first_derived_ask_vol: int = 0
+    underlying_price: Decimal = Decimal(0)
+    simtrade: bool = False
+
+
+class FakeQuote:
+    def __init__(self):
+        self.subscribed: set[tuple[str, str]] = set()
+        self.lock = threading.Lock()
+
+    def set_event_callback(self, func):
+        pass
+
+    def set_on_tick_stk_v1_callback(self, func):
+        pass
+
+    def set_on_bidask_stk_v1_callback(self, func):
+        pass
+
+    def set_on_tick_fop_v1_callback(self, func):
+        pass
+
+    def set_on_bidask_fop_v1_callback(self, func):
+        pass
+
+    def subscribe(self, contract, quote_type=sc.QuoteType.Tick, version=sc.QuoteVersion.v1):
+        with self.lock:
+            self.subscribed.add((contract.code, quote_type.value))
+
+    def unsubscribe(self, contract, quote_type=sc.QuoteType.Tick, version=sc.QuoteVersion.v1):
+        with self.lock:
+            self.subscribed.discard((contract.code, quote_type.value))
+
+
+# stand-in for sj.Shioaji, only what Agent touches
+class FakeShioaji:
+    def __init__(self, future_codes: list[str]):
+        self.quote = FakeQuote()
+        self.futures = [
+            Future(code=code, symbol=code, name=code, delivery_month="202601", underlying_code="TXF")
+            for code in future_codes
+        ]
+        self.Contracts = SimpleNamespace(Stocks=[], Futures=[self.futures], Options=[])
+        self.stock_account = SimpleNamespace(signed=True)
+        self.futopt_account = SimpleNamespace(signed=True)
+
+    def login(self, api_key, secret_key, fetch_contract=True, contracts_cb=None, subscribe_trade=True):
+        if fetch_contract:
+            self.fetch_contracts(contracts_cb=contracts_cb)
+        return []
+
+    def fetch_contracts(self, contract_download=False, contracts_timeout=0, contracts_cb=None):
+        if contracts_cb is not None:
+            for security_type in sc.SecurityType:
+                contracts_cb(security_type)
+
+    def activate_ca(self, ca_path, ca_passwd, person_id="", store=0):
+        return True
+
+    def set_order_callback(self, func):
+        pass
+
+    def update_status(self, *args, **kwargs):
+        pass
+
+    def list_trades(self):
+        return []
+
+    def usage(self, *args, **kwargs):
+        return SimpleNamespace(connections=1, bytes=0, limit_bytes=0, remaining_bytes=0)
+
+    def logout(self):
+        return True
+
+
+# push synthetic ticks/bidasks into agent callbacks at a fixed total rate across codes,
+# datetime is the generation time so clients can measure end-to-end latency
+class QuoteDriver:
+    def __init__(self, agent, codes: list[str], rate: int, bidask: bool):
+        self.agent = agent
+        self.codes = codes
+        self.rate = rate
+        self.bidask = bidask
+        self.sent = 0
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+
+    def __quote(self, code: str):
+        price = Decimal(20000 + random.randint(-50, 50))
+        if self.bidask:
+            return FakeBidAskFOPv1(
+                code=code,
+                datetime=datetime.now(),
+                bid_total_vol=100,
+                ask_total_vol=100,
+                bid_price=[price - i for i in range(5)],
+                bid_volume=[random.randint(1, 20) for _ in range(5)],
+                diff_bid_vol=[0] * 5,
+                ask_price=[price + 1 + i for i in range(5)],
+                ask_volume=[random.randint(1, 20) for _ in range(5)],
+                diff_ask_vol=[0] * 5,
+                underlying_price=price,
+            )
+        return FakeTickFOPv1(
+            code=code,
+            datetime=datetime.now(),
+            open=price,
+            underlying_price=price,
+            bid_side_total_vol=100,
+            ask_side_total_vol=100,
+            avg_price=price,
+            close=price,
+            high=price,
+            low=price,
+            amount=price,
+            total_amount=price,
+            volume=1,
+            total_volume=self.sent,
+            tick_type=1,
+            chg_type=3,
+            price_chg=Decimal(0),
+            pct_chg=Decimal(0),
+        )
+
+    def __run(self):
+        callback = self.agent.future_bid_ask_callback if self.bidask else self.agent.future_tick_callback
+        start = time.perf_counter()
+        while not self.__stopped.is_set():
+            due = int((time.perf_counter() - start) * self.rate)
+            while self.sent < due:
+                callback(sc.Exchange.TAIFEX, self.__quote(self.codes[self.sent % len(self.codes)]))
+                self.sent += 1
+            time.sleep(0.0005)
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import grpc
+from panther.stream import stream_pb2, stream_pb2_grpc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_shioaji import FakeShioaji, QuoteDriver  # noqa: E402
+
+from agent.agent import Agent  # noqa: E402
+from config.auth import APISecret, CASecret, ShioajiAuth  # noqa: E402
+from config.config import Config  # noqa: E402
+from controller.grpc.server import GRPCServer  # noqa: E402
+from controller.grpc.v1.stream import DATE_TIME_FORMAT  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+LATENCY_SAMPLE_EVERY = 10
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def consume(port: str, codes: list[str], bidask: bool, duration: float) -> tuple[int, list[float]]:
+    received = 0
+    latencies: list[float] = []
+
+    async def one(stub, code: str):
+        nonlocal received
+        request = stream_pb2.SubscribeFutureRequest(code=code)
+        call = stub.SubscribeFutureBidAsk(request) if bidask else stub.SubscribeFutureTick(request)
+        async for message in call:
+            received += 1
+            if received % LATENCY_SAMPLE_EVERY == 0:
+                sent = datetime.strptime(message.date_time, DATE_TIME_FORMAT)
+                latencies.append((datetime.now() - sent).total_seconds())
+
+    async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+        stub = stream_pb2_grpc.StreamInterfaceStub(channel)
+        tasks = [asyncio.create_task(one(stub, code)) for code in codes]
+        await asyncio.sleep(duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return received, latencies
+
+
+def client_process(port: str, codes: list[str], bidask: bool, duration: float, results):
+    results.put(asyncio.run(consume(port, codes, bidask, duration)))
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="titan-bench-")
+    os.chdir(workdir)
+    codes = [f"BENCH{i:03d}" for i in range(args.codes)]
+    cfg = Config(
+        shioaji_auth=ShioajiAuth(
+            api_secret=APISecret(api_key="", api_key_secret=""),
+            ca_secret=CASecret(person_id="", ca_path="", ca_password=""),
+        )
+    )
+    agent = Agent(cfg.stream, api=FakeShioaji(codes))
+    agent.login(cfg.shioaji_auth, is_main=False)
+    server = GRPCServer(agent=agent, cfg=cfg)
+    threading.Thread(target=server.serve_sync, args=(args.port,), daemon=True).start()
+    time.sleep(1)
+
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(
+            target=client_process, args=(args.port, codes, args.bidask, args.duration + args.warmup, results)
+        )
+        for _ in range(args.clients)
+    ]
+    for client in clients:
+        client.start()
+    time.sleep(args.warmup)
+
+    driver = QuoteDriver(agent, codes, args.rate, args.bidask)
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    driver.start()
+    time.sleep(args.duration)
+    driver.stop()
+    elapsed = time.perf_counter() - started
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    received, latencies = 0, []
+    for _ in clients:
+        count, samples = results.get()
+        received += count
+        latencies.extend(samples)
+    for client in clients:
+        client.join()
+    server.stop()
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    return {
+        "params": {
+            "codes": args.codes,
+            "rate": args.rate,
+            "clients": args.clients,
+            "duration": args.duration,
+            "bidask": args.bidask,
+        },
+        "sent": driver.sent,
+        "received": received,
+        "messages_per_second": received / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "cpu_percent": cpu / elapsed * 100,
+        "rss_mb": rss_mb(),
+    }
+
+
+# fail when throughput drops or latency/cpu/rss grows by more than tolerance
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    if result["messages_per_second"] < baseline["messages_per_second"] * (1 - tolerance):
+        regressions.append("messages_per_second")
+    for key in ("p50_ms", "p99_ms", "cpu_percent", "rss_mb"):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="titan throughput and latency benchmark with a fake shioaji")
+    parser.add_argument("--codes", type=int, default=20)
+    parser.add_argument("--rate", type=int, default=20000, help="quotes per second across all codes")
+    parser.add_argument("--clients", type=int, default=4, help="client processes, each subscribes every code")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--bidask", action="store_true")
+    parser.add_argument("--port", default="56667")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    name = f"{'bidask' if args.bidask else 'tick'}-{args.codes}x{args.rate}x{args.clients}"
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as file:
+            baselines = json.load(file)
+    # the first compare on a machine records the baseline, numbers from other hardware do not compare
+    if args.save_baseline or (args.compare and name not in baselines):
+        if not args.save_baseline:
+            print(f"no baseline for {name}, saved this run as the baseline")
+        baselines[name] = result
+        with open(BASELINE_PATH, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=2)
+        return
+    if args.compare:
+        regressions = compare(result, baselines[name], args.tolerance)
+        if regressions:
+            sys.exit(f"regression in {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
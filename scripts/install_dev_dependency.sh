@@ -3,4 +3,5 @@
 pip3 install -U --no-warn-script-location --no-cache-dir \
   black \
   mypy \
-  pylint
+  pylint \
+  pytest
@@ -1,7 +1,8 @@
 import logging
 import threading
-from queue import Queue, ShutDown
-from typing import List
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, List
 
 import shioaji as sj
 import shioaji.constant as sc
@@ -10,28 +11,97 @@ from panther.stream import stream_pb2
 from shioaji.contracts import Contract, Future, Option, Stock
 from shioaji.order import Trade
 
-from config.auth import ShioajiAuth
+from agent.catalog import Catalog
+from agent.contract_index import ContractIndex
+from agent.greeks import OptionGreeks
+from agent.hub import Hub
+from agent.journal import KIND_BIDASK, KIND_TICK, Journal
+from agent.kbar import KbarBuilder
+from agent.order_book import OrderBook, OrderEvent, OrderRecord
+from agent.order_entry import OrderEntry
+from agent.quote_store import QuoteStore
+from agent.readiness import STAGE_CA, STAGE_CONTRACTS, STAGE_ORDERS, STAGE_SESSION, Readiness
+from agent.shm_ring import ShmRings
+from agent.snapshot import ContractSnapshot
+from agent.subscription import SubscriptionManager
+from agent.tick_store import TickStore
+from config.auth import APISecret, ShioajiAuth
+from config.stream import StreamConfig
 from logger import logger
+from metrics import (
+    CATALOG_BUILD_SECONDS,
+    CATALOG_SIZE_BYTES,
+    ORDER_RECONCILE_SECONDS,
+    QUOTE_RECEIVED,
+    SHIOAJI_USAGE,
+)
 
 logging.getLogger("shioaji").propagate = False
 
+# event and order hubs have a single topic
+SHIOAJI_EVENT = "shioaji_event"
+ORDER_EVENT = "order_event"
+
+
+# stock, future and option details share the same fields
+def contract_detail(detail_type, contract: Contract):
+    return detail_type(
+        category=contract.category,
+        code=contract.code,
+        currency=contract.currency,
+        day_trade=contract.day_trade,
+        delivery_date=contract.delivery_date,
+        delivery_month=contract.delivery_month,
+        exchange=contract.exchange,
+        limit_down=contract.limit_down,
+        limit_up=contract.limit_up,
+        margin_trading_balance=contract.margin_trading_balance,
+        multiplier=contract.multiplier,
+        name=contract.name,
+        option_right=contract.option_right,
+        reference=contract.reference,
+        security_type=contract.security_type,
+        short_selling_balance=contract.short_selling_balance,
+        strike_price=contract.strike_price,
+        symbol=contract.symbol,
+        target_code=contract.target_code,
+        underlying_code=contract.underlying_code,
+        underlying_kind=contract.underlying_kind,
+        unit=contract.unit,
+        update_date=contract.update_date,
+    )
+
 
 class Agent:
     max_subscribe_count = 200
-    current_subscribe_count = 0
+    usage_interval = 30
+    order_reconcile_interval = 60
+    contracts_timeout = 300
 
-    def __init__(self):
-        self.__api = sj.Shioaji()
+    def __init__(self, stream_cfg: StreamConfig | None = None, api: sj.Shioaji | None = None):
+        self.__api = api or sj.Shioaji()
+        self.stream_cfg = stream_cfg or StreamConfig()
         self.__login_progess = int()
         self.__login_status_lock = threading.Lock()
+        self.__contracts_fetched = threading.Event()
+
+        # startup stages, the grpc server is up before login finishes
+        self.readiness = Readiness()
 
         # callback initialization avoid NoneType lint error
-        self.non_block_order_callback = None
+        self.non_block_order_callback = self.order_result_callback
 
-        # order map with lock
-        # key is order_id
-        self.__order_map: dict[str, Trade] = {}
-        self.__order_map_lock = threading.Lock()
+        # order placement, only available on the main session
+        self.order_entry: OrderEntry | None = None
+
+        # local order book, key is order_id
+        # full reconciliation runs on timer or when a gap is detected
+        # every order book change is published with its sequence number
+        self.order_hub = Hub("order")
+        self.order_book = OrderBook(on_event=self.order_event_callback)
+        self.__order_reconcile_lock = threading.Lock()
+        self.__order_reconcile_event = threading.Event()
+        self.__stopped = threading.Event()
 
         # stock, future, option code map
         self.stock_map: dict[str, Contract] = {}
@@ -41,40 +111,78 @@ class Agent:
         self.option_map: dict[str, Contract] = {}
         self.option_map_lock = threading.Lock()
 
-        # subscribe
-        self.sub_lock = threading.Lock()
-        self.tick_sub_dict: dict[str, Contract] = {}
-        self.bidask_sub_dict: dict[str, Contract] = {}
-        self.__tick_queue_map: dict[str, Queue] = {}
-        self.__bidask_queue_map: dict[str, Queue] = {}
+        # pre-serialized contract detail lists
+        self.catalog = Catalog()
+        # option chain, future and stock lookups for the filtered query rpcs
+        self.contract_index = ContractIndex()
+        self.__snapshot = ContractSnapshot()
+
+        # subscribe, tick and bidask hubs are shared by futures and options
+        self.subscription = SubscriptionManager(self.__api, self.max_subscribe_count)
+        self.__quote_sessions: list[sj.Shioaji] = []
+        self.tick_hub = Hub("tick")
+        self.bidask_hub = Hub("bidask")
+        self.stock_tick_hub = Hub("stock_tick")
+        self.stock_bidask_hub = Hub("stock_bidask")
+
+        # fop quote journal for replay
+        self.journal = Journal()
+
+        # ohlcv bars from fop ticks
+        self.kbar = KbarBuilder(self.stream_cfg.kbar_intervals)
+
+        # latest tick and top of book of every subscribed code
+        self.quote_store = QuoteStore()
+
+        # today's fop ticks as columns for late joiners
+        self.tick_store = TickStore()
+
+        # per code shared memory rings, only written once a local consumer opened one
+        self.shm_rings = ShmRings(self.stream_cfg.shm_prefix, self.stream_cfg.shm_capacity)
+
+        # vectorized iv and greeks of tracked option chains
+        self.greeks = OptionGreeks(self.stream_cfg.greeks_interval_ms / 1000, self.stream_cfg.risk_free_rate)
 
         # event callback
-        self.__event_queue: Queue = Queue()
+        self.event_hub = Hub("event")
 
     def event_callback(self, resp_code: int, event_code: int, info: str, event: str):
-        self.__event_queue.put(
+        self.event_hub.publish(
+            SHIOAJI_EVENT,
             stream_pb2.ShioajiEvent(
                 resp_code=resp_code,
                 event_code=event_code,
                 info=info,
                 event=event,
-            )
+            ),
         )
         logger.warning("Resp code: %d, Event code: %d, Info: %s, Event: %s", resp_code, event_code, info, event)
 
     def update_local_order(self):
-        with self.__order_map_lock:
-            cache = self.__order_map.copy()
-            self.__order_map = {}
+        with self.__order_reconcile_lock, ORDER_RECONCILE_SECONDS.time():
             try:
+                since_seq = self.order_book.seq
                 self.__api.update_status()
-                for order in self.__api.list_trades():
-                    self.__order_map[order.order.id] = order
-            except Exception:
-                self.__order_map = cache
+                self.order_book.reconcile(self.__api.list_trades(), since_seq)
+            except Exception as e:
+                logger.error("update local order fail: %s", e)
+
+    def order_reconcile_worker(self):
+        while not self.__stopped.is_set():
+            self.__order_reconcile_event.wait(self.order_reconcile_interval)
+            self.__order_reconcile_event.clear()
+            if self.__stopped.is_set():
+                return
+            self.update_local_order()
 
     def order_callback(self, order_state: sc.OrderState, res: dict):
-        self.update_local_order()  # every time order callback, update local order
+        try:
+            if not self.order_book.apply(order_state, res):
+                logger.warning("order book gap detected, reconcile")
+                self.__order_reconcile_event.set()
+        except Exception as e:
+            logger.error("apply order event fail: %s", e)
+            self.__order_reconcile_event.set()
         if order_state in (sc.OrderState.FuturesOrder, sc.OrderState.StockOrder):
             if res["contract"]["code"] is None:
                 logger.error("place order code is none")
@@ -101,49 +209,200 @@ class Agent:
                 res["trade_id"],
             )
 
+    # response of a non-blocking place, update or cancel, exchange events still arrive on order_callback
+    def order_result_callback(self, trade: Trade):
+        if trade.status.status == sc.Status.Failed:
+            logger.error("order %s %s fail: %s", trade.order.id, trade.contract.code, trade.status.msg)
+            self.order_book.reject(OrderRecord.from_trade(trade))
+
+    def order_event_callback(self, event: OrderEvent):
+        self.order_hub.publish(ORDER_EVENT, event)
+
     def login_cb(self, security_type: sc.SecurityType):
         with self.__login_status_lock:
             if security_type.value in [item.value for item in sc.SecurityType]:
                 self.__login_progess += 1
                 logger.info("login progress: %d/4, %s", self.__login_progess, security_type)
+                if self.__login_progess == 4:
+                    self.__contracts_fetched.set()
+
+    def set_quote_callbacks(self, api: sj.Shioaji):
+        api.quote.set_event_callback(self.event_callback)
+        api.quote.set_on_tick_stk_v1_callback(self.stock_tick_callback)
+        api.quote.set_on_bidask_stk_v1_callback(self.stock_bid_ask_callback)
+        api.quote.set_on_tick_fop_v1_callback(self.future_tick_callback)
+        api.quote.set_on_bidask_fop_v1_callback(self.future_bid_ask_callback)
+
+    # login in background so the grpc server can serve health and readiness right away
+    # on_error is called when any stage fails, the process is not usable without all of them
+    def start(
+        self,
+        auth: ShioajiAuth,
+        is_main: bool,
+        quote_sessions: list[APISecret] | None = None,
+        on_error: Callable[[], None] | None = None,
+    ):
+        def run():
+            try:
+                self.login(auth, is_main, quote_sessions)
+            except Exception as e:
+                logger.error("login fail: %s", e)
+                self.readiness.fail(str(e))
+                if on_error is not None:
+                    on_error()
+
+        threading.Thread(target=run, daemon=True).start()
+        return self
 
-    def login(self, auth: ShioajiAuth, is_main: bool):
+    # contract filling, ca activation with order sync and quote sessions run concurrently
+    # each stage is marked in readiness as soon as it is done, the first failing stage fails the login
+    # without waiting for the others
+    def login(self, auth: ShioajiAuth, is_main: bool, quote_sessions: list[APISecret] | None = None):
         logger.info("Shioaji version: %s", self.get_sj_version())
-        self.__api.quote.set_event_callback(self.event_callback)
-        self.__api.quote.set_on_tick_fop_v1_callback(self.future_tick_callback)
-        self.__api.quote.set_on_bidask_fop_v1_callback(self.future_bid_ask_callback)
+        self.journal.start()
+        self.greeks.start()
+        self.set_quote_callbacks(self.__api)
+        restored = self.restore_contract_snapshot()
         self.__api.login(
             api_key=auth.api_key,
             secret_key=auth.api_key_secret,
+            fetch_contract=not restored,
             contracts_cb=self.login_cb,
             subscribe_trade=is_main,
         )
-        while True:
-            with self.__login_status_lock:
-                if self.__login_progess == 4:
-                    break
+        self.readiness.set(STAGE_SESSION)
+        if not is_main:
+            self.readiness.skip(STAGE_ORDERS)
+        if restored:
+            self.readiness.set(STAGE_CONTRACTS)
+            threading.Thread(target=self.refresh_contracts, daemon=True).start()
+        pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="login")
+        stages = [
+            pool.submit(self.activate, auth, is_main),
+            pool.submit(self.login_quote_sessions, quote_sessions or []),
+        ]
+        if not restored:
+            stages.append(pool.submit(self.load_contracts))
+        pool.shutdown(wait=False)
+        done, _ = wait(stages, return_when=FIRST_EXCEPTION)
+        for stage in done:
+            error = stage.exception()
+            if error is not None:
+                raise error
+        threading.Thread(target=self.usage_worker, daemon=True).start()
+        return self
+
+    def load_contracts(self):
+        self.wait_contracts()
+        self.fill_contract_maps()
+        self.readiness.set(STAGE_CONTRACTS)
+
+    # order sync only needs the ca and the trade subscription, not the contract maps
+    def activate(self, auth: ShioajiAuth, is_main: bool):
         self.__api.activate_ca(
             ca_path=f"./pfx/{auth.ca_path}",
             ca_passwd=auth.ca_password,
             person_id=auth.person_id,
         )
-        self.fill_stock_map()
-        self.fill_future_map()
-        self.fill_option_map()
+        self.readiness.set(STAGE_CA)
         if is_main is True:
             if self.__api.stock_account.signed is False or self.__api.futopt_account.signed is False:
                 raise RuntimeError("account not sign")
             self.__api.set_order_callback(self.order_callback)
+            self.order_entry = OrderEntry(self.__api, self.non_block_order_callback)
             self.update_local_order()
+            threading.Thread(target=self.order_reconcile_worker, daemon=True).start()
+            self.readiness.set(STAGE_ORDERS)
 
-        return self
+    def login_quote_sessions(self, quote_sessions: list[APISecret]):
+        for secret in quote_sessions:
+            self.login_quote_session(secret)
+
+    # quote only session, contracts come from the main session and callbacks feed the same hubs
+    def login_quote_session(self, secret: APISecret):
+        api = sj.Shioaji()
+        self.set_quote_callbacks(api)
+        try:
+            api.login(
+                api_key=secret.api_key,
+                secret_key=secret.api_key_secret,
+                fetch_contract=False,
+                subscribe_trade=False,
+            )
+        except Exception as e:
+            logger.error("login quote session fail: %s", e)
+            return
+        self.__quote_sessions.append(api)
+        self.subscription.add_session(api)
+        logger.info("quote session %d ready, capacity: %d", len(self.__quote_sessions), self.subscription.capacity)
+
+    # set by login_cb once all four security types are fetched
+    def wait_contracts(self):
+        if not self.__contracts_fetched.wait(self.contracts_timeout):
+            raise TimeoutError(f"contracts not fetched in {self.contracts_timeout}s")
+
+    def fill_contract_maps(self):
+        self.fill_stock_map()
+        self.fill_future_map()
+        self.fill_option_map()
+        try:
+            with self.stock_map_lock, self.future_map_lock, self.option_map_lock:
+                contract_maps = {
+                    "stock": self.stock_map.copy(),
+                    "future": self.future_map.copy(),
+                    "option": self.option_map.copy(),
+                }
+            self.__snapshot.save(contract_maps)
+        except Exception as e:
+            logger.error("save contract snapshot fail: %s", e)
+
+    def restore_contract_snapshot(self) -> bool:
+        contract_maps = self.__snapshot.load()
+        if contract_maps is None:
+            return False
+        with self.stock_map_lock:
+            self.stock_map = contract_maps["stock"]
+        with self.future_map_lock:
+            self.future_map = contract_maps["future"]
+        with self.option_map_lock:
+            self.option_map = contract_maps["option"]
+        self.build_stock_catalog()
+        self.build_future_catalog()
+        self.build_option_catalog()
+        logger.info(
+            "restore contracts from snapshot, stock: %d, future: %d, option: %d",
+            len(contract_maps["stock"]),
+            len(contract_maps["future"]),
+            len(contract_maps["option"]),
+        )
+        return True
+
+    # snapshot is only a warm start, contracts are still downloaded and refilled in background
+    def refresh_contracts(self):
+        try:
+            self.__api.fetch_contracts(contracts_cb=self.login_cb)
+            self.wait_contracts()
+            self.fill_contract_maps()
+            logger.info("contracts refreshed")
+        except Exception as e:
+            logger.error("refresh contracts fail: %s", e)
 
     def logout(self):
         try:
-            self.__event_queue.shutdown()
-            with self.sub_lock:
-                for code in list(self.__tick_queue_map.keys()):
-                    self.__tick_queue_map[code].shutdown()
+            self.__stopped.set()
+            self.__order_reconcile_event.set()
+            self.event_hub.close()
+            self.order_hub.close()
+            self.tick_hub.close()
+            self.bidask_hub.close()
+            self.stock_tick_hub.close()
+            self.stock_bidask_hub.close()
+            self.journal.stop()
+            self.kbar.hub.close()
+            self.greeks.stop()
+            self.shm_rings.close_all()
+            for api in self.__quote_sessions:
+                api.logout()
             self.__api.logout()
             logger.info("logout shioaji")
         except Exception:
@@ -152,58 +411,70 @@ class Agent:
     def get_usage(self):
         return self.__api.usage()
 
+    def usage_worker(self):
+        while not self.__stopped.wait(self.usage_interval):
+            try:
+                usage = self.get_usage()
+                SHIOAJI_USAGE.labels("connections").set(usage.connections)
+                SHIOAJI_USAGE.labels("bytes").set(usage.bytes)
+                SHIOAJI_USAGE.labels("limit_bytes").set(usage.limit_bytes)
+                SHIOAJI_USAGE.labels("remaining_bytes").set(usage.remaining_bytes)
+            except Exception as e:
+                logger.error("get usage fail: %s", e)
+
+    def hubs(self) -> list[Hub]:
+        return [
+            self.tick_hub,
+            self.bidask_hub,
+            self.stock_tick_hub,
+            self.stock_bidask_hub,
+            self.event_hub,
+            self.order_hub,
+            self.kbar.hub,
+            self.greeks.hub,
+        ]
+
     def get_sj_version(self):
         return str(sj.__version__)
 
+    # maps are rebuilt and swapped in, so contracts that expired since a restored snapshot are dropped
     def fill_stock_map(self):
+        stock_map: dict[str, Contract] = {}
         for contracts in self.__api.Contracts.Stocks:
             for contract in contracts:
                 if contract.category == "00":
                     continue
-                with self.stock_map_lock:
-                    if isinstance(contract, Stock):
-                        self.stock_map[contract.code] = contract
-
+                if isinstance(contract, Stock):
+                    stock_map[contract.code] = contract
         with self.stock_map_lock:
-            logger.info("total stock: %d", len(self.stock_map))
+            self.stock_map = stock_map
+        logger.info("total stock: %d", len(stock_map))
+        self.build_stock_catalog()
+
+    def build_catalog(self, kind: str, detail_list, get_all):
+        start = time.perf_counter()
+        details = get_all()
+        entry = self.catalog.update(kind, detail_list(list=details), len(details))
+        CATALOG_BUILD_SECONDS.labels(kind).observe(time.perf_counter() - start)
+        CATALOG_SIZE_BYTES.labels(kind).set(len(entry.payload))
+        logger.info("%s catalog version: %s, size: %d bytes", kind, entry.version, len(entry.payload))
+
+    def build_stock_catalog(self):
+        self.build_catalog("stock", stock_pb2.StockDetailList, self.get_all_stocks)
+        with self.stock_map_lock:
+            stock_map = self.stock_map.copy()
+        self.contract_index.index_stocks(stock_map)
 
     def get_all_stocks(self) -> List[stock_pb2.StockDetail]:
         with self.stock_map_lock:
-            return [
-                stock_pb2.StockDetail(
-                    category=contract.category,
-                    code=code,
-                    currency=contract.currency,
-                    day_trade=contract.day_trade,
-                    delivery_date=contract.delivery_date,
-                    delivery_month=contract.delivery_month,
-                    exchange=contract.exchange,
-                    limit_down=contract.limit_down,
-                    limit_up=contract.limit_up,
-                    margin_trading_balance=contract.margin_trading_balance,
-                    multiplier=contract.multiplier,
-                    name=contract.name,
-                    option_right=contract.option_right,
-                    reference=contract.reference,
-                    security_type=contract.security_type,
-                    short_selling_balance=contract.short_selling_balance,
-                    strike_price=contract.strike_price,
-                    symbol=contract.symbol,
-                    target_code=contract.target_code,
-                    underlying_code=contract.underlying_code,
-                    underlying_kind=contract.underlying_kind,
-                    unit=contract.unit,
-                    update_date=contract.update_date,
-                )
-                for code, contract in self.stock_map.items()
-            ]
+            return [contract_detail(stock_pb2.StockDetail, contract) for contract in self.stock_map.values()]
 
     def fill_future_map(self):
+        future_map: dict[str, Contract] = {}
         for contracts in self.__api.Contracts.Futures:
             for contract in contracts:
-                with self.future_map_lock:
-                    if isinstance(contract, Future):
-                        self.future_map[contract.code] = contract
+                if isinstance(contract, Future):
+                    future_map[contract.code] = contract
             for contract in contracts:
                 if "微型臺指" in contract.name:
                     logger.info("Found future: %s with code: %s", contract.name, contract.code)
@@ -212,38 +483,19 @@ class Agent:
                 if "臺股期貨" in contract.name:
                     logger.info("Found future: %s with code: %s", contract.name, contract.code)
         with self.future_map_lock:
-            logger.info("total future: %d", len(self.future_map))
+            self.future_map = future_map
+        logger.info("total future: %d", len(future_map))
+        self.build_future_catalog()
+
+    def build_future_catalog(self):
+        self.build_catalog("future", future_pb2.FutureDetailList, self.get_all_futures)
+        with self.future_map_lock:
+            future_map = self.future_map.copy()
+        self.contract_index.index_futures(future_map)
 
     def get_all_futures(self) -> List[future_pb2.FutureDetail]:
         with self.future_map_lock:
-            return [
-                future_pb2.FutureDetail(
-                    category=contract.category,
-                    code=code,
-                    currency=contract.currency,
-                    day_trade=contract.day_trade,
-                    delivery_date=contract.delivery_date,
-                    delivery_month=contract.delivery_month,
-                    exchange=contract.exchange,
-                    limit_down=contract.limit_down,
-                    limit_up=contract.limit_up,
-                    margin_trading_balance=contract.margin_trading_balance,
-                    multiplier=contract.multiplier,
-                    name=contract.name,
-                    option_right=contract.option_right,
-                    reference=contract.reference,
-                    security_type=contract.security_type,
-                    short_selling_balance=contract.short_selling_balance,
-                    strike_price=contract.strike_price,
-                    symbol=contract.symbol,
-                    target_code=contract.target_code,
-                    underlying_code=contract.underlying_code,
-                    underlying_kind=contract.underlying_kind,
-                    unit=contract.unit,
-                    update_date=contract.update_date,
-                )
-                for code, contract in self.future_map.items()
-            ]
+            return [contract_detail(future_pb2.FutureDetail, contract) for contract in self.future_map.values()]
 
     def get_future_contract_by_code(self, code):
         with self.future_map_lock:
@@ -253,141 +505,109 @@ class Agent:
                 return None
 
     def fill_option_map(self):
+        option_map: dict[str, Contract] = {}
         for contracts in self.__api.Contracts.Options:
             for contract in contracts:
-                with self.option_map_lock:
-                    if isinstance(contract, Option):
-                        self.option_map[contract.code] = contract
+                if isinstance(contract, Option):
+                    option_map[contract.code] = contract
         with self.option_map_lock:
-            logger.info("total option: %d", len(self.option_map))
+            self.option_map = option_map
+        logger.info("total option: %d", len(option_map))
+        self.build_option_catalog()
+
+    def build_option_catalog(self):
+        self.build_catalog("option", option_pb2.OptionDetailList, self.get_all_options)
+        with self.option_map_lock:
+            option_map = self.option_map.copy()
+        self.contract_index.index_options(option_map)
 
     def get_all_options(self) -> List[option_pb2.OptionDetail]:
         with self.option_map_lock:
-            return [
-                option_pb2.OptionDetail(
-                    category=contract.category,
-                    code=code,
-                    currency=contract.currency,
-                    day_trade=contract.day_trade,
-                    delivery_date=contract.delivery_date,
-                    delivery_month=contract.delivery_month,
-                    exchange=contract.exchange,
-                    limit_down=contract.limit_down,
-                    limit_up=contract.limit_up,
-                    margin_trading_balance=contract.margin_trading_balance,
-                    multiplier=contract.multiplier,
-                    name=contract.name,
-                    option_right=contract.option_right,
-                    reference=contract.reference,
-                    security_type=contract.security_type,
-                    short_selling_balance=contract.short_selling_balance,
-                    strike_price=contract.strike_price,
-                    symbol=contract.symbol,
-                    target_code=contract.target_code,
-                    underlying_code=contract.underlying_code,
-                    underlying_kind=contract.underlying_kind,
-                    unit=contract.unit,
-                    update_date=contract.update_date,
-                )
-                for code, contract in self.option_map.items()
-            ]
-
-    def subscribe_future_tick(self, code):
-        with self.sub_lock:
-            if code in self.tick_sub_dict:
-                return -1
-            if self.current_subscribe_count >= self.max_subscribe_count:
-                return -1
-            try:
-                contract = self.get_future_contract_by_code(code)
-                if contract is None:
-                    logger.error("contract %s not found", code)
-                    return code
-                self.__api.quote.subscribe(
-                    contract,
-                    quote_type=sc.QuoteType.Tick,
-                    version=sc.QuoteVersion.v1,
-                )
-                self.current_subscribe_count += 1
-                self.tick_sub_dict[code] = contract
-                self.__tick_queue_map[code] = Queue()
-                logger.info(
-                    "subscribe future tick %s %s",
-                    code,
-                    contract.name,
-                )
-                return None
-            except Exception:
-                return code
-
-    def subscribe_future_bidask(self, code):
-        with self.sub_lock:
-            if code in self.bidask_sub_dict:
-                return -1
-            if self.current_subscribe_count >= self.max_subscribe_count:
-                return -1
-            try:
-                contract = self.get_future_contract_by_code(code)
-                if contract is None:
-                    logger.error("contract %s not found", code)
-                    return code
-                self.__api.quote.subscribe(
-                    contract,
-                    quote_type=sc.QuoteType.BidAsk,
-                    version=sc.QuoteVersion.v1,
-                )
-                self.current_subscribe_count += 1
-                self.bidask_sub_dict[code] = contract
-                self.__bidask_queue_map[code] = Queue()
-                logger.info(
-                    "subscribe future bidask %s %s",
-                    code,
-                    contract.name,
-                )
-                return None
-            except Exception:
-                return code
-
-    # def unsubscribe_future_tick(self, code):
-    #     with self.sub_lock:
-    #         if code in self.tick_sub_dict:
-    #             try:
-    #                 self.__api.quote.unsubscribe(
-    #                     self.tick_sub_dict[code],
-    #                     quote_type=sc.QuoteType.Tick,
-    #                     version=sc.QuoteVersion.v1,
-    #                 )
-    #                 del self.tick_sub_dict[code]
-    #                 logger.info(
-    #                     "unsubscribe future tick %s %s",
-    #                     code,
-    #                     self.get_future_contract_by_code(code).name,
-    #                 )
-    #                 return None
-    #             except Exception:
-    #                 return code
-    #         else:
-    #             return -1
+            return [contract_detail(option_pb2.OptionDetail, contract) for contract in self.option_map.values()]
+
+    def details_by_codes(self, detail_type, contract_map: dict[str, Contract], lock, codes: list[str]) -> list:
+        with lock:
+            contracts = [contract_map[code] for code in codes if code in contract_map]
+        return [contract_detail(detail_type, contract) for contract in contracts]
+
+    def query_option_chain(
+        self, product: str, delivery_month: str, strike_min: float, strike_max: float, option_right: str
+    ) -> List[option_pb2.OptionDetail]:
+        codes = self.contract_index.option_chain(product, delivery_month, strike_min, strike_max, option_right)
+        return self.details_by_codes(option_pb2.OptionDetail, self.option_map, self.option_map_lock, codes)
+
+    def query_futures(self, underlying_code: str, category: str, symbol: str) -> List[future_pb2.FutureDetail]:
+        codes = self.contract_index.futures(underlying_code, category, symbol)
+        if codes is None:
+            return self.get_all_futures()
+        return self.details_by_codes(future_pb2.FutureDetail, self.future_map, self.future_map_lock, codes)
+
+    def query_stocks(self, category: str, exchange: str) -> List[stock_pb2.StockDetail]:
+        codes = self.contract_index.stocks(category, exchange)
+        if codes is None:
+            return self.get_all_stocks()
+        return self.details_by_codes(stock_pb2.StockDetail, self.stock_map, self.stock_map_lock, codes)
+
+    # option contracts of one chain, both rights
+    def option_chain_contracts(self, product: str, delivery_month: str, strike_min: float, strike_max: float):
+        codes = self.contract_index.option_chain(product, delivery_month, strike_min, strike_max)
+        with self.option_map_lock:
+            return [self.option_map[code] for code in codes if code in self.option_map]
 
+    def get_stock_contract_by_code(self, code):
+        with self.stock_map_lock:
+            return self.stock_map.get(code, None)
+
+    def get_option_contract_by_code(self, code):
+        with self.option_map_lock:
+            return self.option_map.get(code, None)
+
+    # futures and options share the fop quote callbacks
+    def get_fop_contract_by_code(self, code):
+        contract = self.get_future_contract_by_code(code)
+        if contract is None:
+            contract = self.get_option_contract_by_code(code)
+        return contract
+
+    # return None on success, -1 when quota is full, code on error
+    def subscribe(self, code: str, quote_type: sc.QuoteType, is_stock: bool = False):
+        if is_stock:
+            contract = self.get_stock_contract_by_code(code)
+        else:
+            contract = self.get_fop_contract_by_code(code)
+        if contract is None:
+            logger.error("contract %s not found", code)
+            return code
+        return self.subscription.acquire(contract, quote_type)
+
+    def unsubscribe(self, code: str, quote_type: sc.QuoteType):
+        self.subscription.release(code, quote_type)
+
+    def stock_tick_callback(self, _, tick: sj.TickSTKv1):
+        QUOTE_RECEIVED.labels("stock_tick", tick.code).inc()
+        self.stock_tick_hub.publish(tick.code, tick)
+        self.quote_store.update_tick(tick)
+
+    def stock_bid_ask_callback(self, _, bidask: sj.BidAskSTKv1):
+        QUOTE_RECEIVED.labels("stock_bidask", bidask.code).inc()
+        self.stock_bidask_hub.publish(bidask.code, bidask)
+        self.quote_store.update_bidask(bidask)
+
+    # tick store is appended before publish so a history read after attach never misses a tick
     def future_tick_callback(self, _, tick: sj.TickFOPv1):
-        try:
-            self.__tick_queue_map[tick.code].put(tick)
-        except ShutDown:
-            pass
+        QUOTE_RECEIVED.labels("tick", tick.code).inc()
+        self.tick_store.append(tick)
+        self.tick_hub.publish(tick.code, tick)
+        self.quote_store.update_tick(tick)
+        self.shm_rings.write_tick(tick)
+        self.journal.append(KIND_TICK, tick)
+        self.kbar.update(tick)
+        self.greeks.update_tick(tick)
 
     def future_bid_ask_callback(self, _, bidask: sj.BidAskFOPv1):
-        try:
-            self.__bidask_queue_map[bidask.code].put(bidask)
-        except ShutDown:
-            pass
-
-    def get_event_queue(self):
-        return self.__event_queue
-
-    def get_tick_queue(self, code: str):
-        with self.sub_lock:
-            return self.__tick_queue_map.get(code, None)
-
-    def get_bidask_queue(self, code: str):
-        with self.sub_lock:
-            return self.__bidask_queue_map.get(code, None)
+        QUOTE_RECEIVED.labels("bidask", bidask.code).inc()
+        self.bidask_hub.publish(bidask.code, bidask)
+        self.quote_store.update_bidask(bidask)
+        self.shm_rings.write_bidask(bidask)
+        self.journal.append(KIND_BIDASK, bidask)
+        self.greeks.update_bidask(bidask)
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+
+from agent.record import datetime_to_ns, levels
+
+BID, ASK = 0, 1
+
+# scalar fields in changed mask bit order
+SCALAR_FIELDS = (
+    "bid_total_vol",
+    "ask_total_vol",
+    "underlying_price",
+    "first_derived_bid_price",
+    "first_derived_ask_price",
+    "first_derived_bid_vol",
+    "first_derived_ask_vol",
+)
+
+
+@dataclass(frozen=True)
+class LevelChange:
+    side: int
+    level: int
+    price: float
+    volume: int
+
+
+# scalar fields are None when unchanged since the last message sent to this subscriber
+# changed has bit i set when SCALAR_FIELDS[i] is sent, so a value that changed to zero is not read as unchanged
+@dataclass(frozen=True)
+class BidAskDelta:
+    seq: int
+    code: str
+    ts: int
+    full: bool
+    levels: list[LevelChange]
+    changed: int
+    bid_total_vol: int | None
+    ask_total_vol: int | None
+    underlying_price: float | None
+    first_derived_bid_price: float | None
+    first_derived_ask_price: float | None
+    first_derived_bid_vol: int | None
+    first_derived_ask_vol: int | None
+
+
+# per subscriber and code, diffs each book against the last one sent
+# a full book is sent first, as every snapshot_interval-th message and after resync
+# diff_bid_vol/diff_ask_vol are left out, clients derive them from consecutive volumes
+class BidAskDeltaEncoder:
+    def __init__(self, snapshot_interval: int):
+        self.snapshot_interval = snapshot_interval
+        self.seq = 0
+        self.__since_full = 0
+        self.__book: tuple[list, list, list, list] | None = None
+        self.__scalars: tuple | None = None
+
+    def resync(self):
+        self.__book = None
+
+    def encode(self, bidask) -> BidAskDelta:
+        book = (
+            levels([float(v) for v in bidask.bid_price], 0.0),
+            levels(bidask.bid_volume, 0),
+            levels([float(v) for v in bidask.ask_price], 0.0),
+            levels(bidask.ask_volume, 0),
+        )
+        scalars = (
+            bidask.bid_total_vol,
+            bidask.ask_total_vol,
+            float(bidask.underlying_price),
+            float(bidask.first_derived_bid_price),
+            float(bidask.first_derived_ask_price),
+            bidask.first_derived_bid_vol,
+            bidask.first_derived_ask_vol,
+        )
+        # since_full counts the deltas after the last full book, a full book diffs against nothing
+        last_book, last_scalars = self.__book, self.__scalars
+        if last_book is None or last_scalars is None or self.__since_full >= self.snapshot_interval - 1:
+            last_book, last_scalars = None, None
+        full = last_book is None
+        changes = []
+        for side, (prices, volumes) in ((BID, book[:2]), (ASK, book[2:])):
+            for level, (price, volume) in enumerate(zip(prices, volumes)):
+                if last_book is None or price != last_book[side * 2][level] or volume != last_book[side * 2 + 1][level]:
+                    changes.append(LevelChange(side, level, price, volume))
+        if last_scalars is None:
+            sent: tuple = scalars
+        else:
+            sent = tuple(v if v != last else None for v, last in zip(scalars, last_scalars))
+        changed = sum(1 << i for i, v in enumerate(sent) if v is not None)
+        self.__since_full = 0 if full else self.__since_full + 1
+        self.__book = book
+        self.__scalars = scalars
+        self.seq += 1
+        return BidAskDelta(self.seq, bidask.code, datetime_to_ns(bidask.datetime), full, changes, changed, *sent)
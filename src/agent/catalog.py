@@ -0,0 +1,34 @@
+import hashlib
+import threading
+from dataclasses import dataclass
+
+from google.protobuf.message import Message
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    payload: bytes
+    version: str
+    count: int
+
+
+# pre-serialized contract detail lists, rebuilt only when contract maps are filled
+class Catalog:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, CatalogEntry] = {}
+
+    def update(self, kind: str, message: Message, count: int) -> CatalogEntry:
+        payload = message.SerializeToString(deterministic=True)
+        entry = CatalogEntry(
+            payload=payload,
+            version=hashlib.blake2b(payload, digest_size=8).hexdigest(),
+            count=count,
+        )
+        with self.__lock:
+            self.__entries[kind] = entry
+        return entry
+
+    def get(self, kind: str) -> CatalogEntry | None:
+        with self.__lock:
+            return self.__entries.get(kind, None)
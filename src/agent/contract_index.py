@@ -0,0 +1,121 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from shioaji.contracts import Contract
+
+
+def enum_value(value) -> str:
+    return str(getattr(value, "value", value) or "")
+
+
+# option chain of one product and delivery month, sorted by strike
+class OptionChain:
+    def __init__(self, contracts: list[Contract]):
+        contracts = sorted(contracts, key=lambda c: (float(c.strike_price), enum_value(c.option_right)))
+        self.strikes = [float(c.strike_price) for c in contracts]
+        self.codes = [c.code for c in contracts]
+        self.rights = [enum_value(c.option_right) for c in contracts]
+
+    # strike bounds are inclusive, zero means unbounded
+    def select(self, strike_min: float = 0, strike_max: float = 0, option_right: str = "") -> list[str]:
+        lo = bisect_left(self.strikes, strike_min) if strike_min else 0
+        hi = bisect_right(self.strikes, strike_max) if strike_max else len(self.strikes)
+        return [self.codes[i] for i in range(lo, hi) if not option_right or self.rights[i] == option_right]
+
+
+# secondary indexes over the contract maps, rebuilt whenever a map is filled or restored
+# each index is swapped as a whole so readers never see a half built one
+class ContractIndex:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # option product (category or underlying code) -> delivery month -> chain
+        self.__option_chains: dict[str, dict[str, OptionChain]] = {}
+        self.__future_by_underlying: dict[str, list[str]] = {}
+        self.__future_by_category: dict[str, list[str]] = {}
+        self.__future_by_symbol: dict[str, str] = {}
+        self.__stock_by_category: dict[str, list[str]] = {}
+        self.__stock_by_exchange: dict[str, list[str]] = {}
+
+    def index_options(self, option_map: dict[str, Contract]):
+        grouped: dict[str, dict[str, list[Contract]]] = defaultdict(lambda: defaultdict(list))
+        for contract in option_map.values():
+            grouped[contract.category][contract.delivery_month].append(contract)
+            if contract.underlying_code and contract.underlying_code != contract.category:
+                grouped[contract.underlying_code][contract.delivery_month].append(contract)
+        chains = {
+            product: {month: OptionChain(contracts) for month, contracts in months.items()}
+            for product, months in grouped.items()
+        }
+        with self.__lock:
+            self.__option_chains = chains
+
+    def index_futures(self, future_map: dict[str, Contract]):
+        by_underlying: dict[str, list[str]] = defaultdict(list)
+        by_category: dict[str, list[str]] = defaultdict(list)
+        by_symbol: dict[str, str] = {}
+        for code, contract in future_map.items():
+            if contract.underlying_code:
+                by_underlying[contract.underlying_code].append(code)
+            by_category[contract.category].append(code)
+            by_symbol[contract.symbol] = code
+        with self.__lock:
+            self.__future_by_underlying = dict(by_underlying)
+            self.__future_by_category = dict(by_category)
+            self.__future_by_symbol = by_symbol
+
+    def index_stocks(self, stock_map: dict[str, Contract]):
+        by_category: dict[str, list[str]] = defaultdict(list)
+        by_exchange: dict[str, list[str]] = defaultdict(list)
+        for code, contract in stock_map.items():
+            by_category[contract.category].append(code)
+            by_exchange[enum_value(contract.exchange)].append(code)
+        with self.__lock:
+            self.__stock_by_category = dict(by_category)
+            self.__stock_by_exchange = dict(by_exchange)
+
+    def option_months(self, product: str) -> list[str]:
+        with self.__lock:
+            return sorted(self.__option_chains.get(product, {}))
+
+    # empty delivery month selects every month of the product
+    def option_chain(
+        self, product: str, delivery_month: str = "", strike_min: float = 0, strike_max: float = 0, option_right=""
+    ) -> list[str]:
+        with self.__lock:
+            months = self.__option_chains.get(product, {})
+        if delivery_month:
+            chains = [months[delivery_month]] if delivery_month in months else []
+        else:
+            chains = [months[month] for month in sorted(months)]
+        return [code for chain in chains for code in chain.select(strike_min, strike_max, option_right)]
+
+    # filters are combined with and, empty filter matches everything
+    def futures(self, underlying_code: str = "", category: str = "", symbol: str = "") -> list[str] | None:
+        with self.__lock:
+            selected = []
+            if underlying_code:
+                selected.append(self.__future_by_underlying.get(underlying_code, []))
+            if category:
+                selected.append(self.__future_by_category.get(category, []))
+            if symbol:
+                code = self.__future_by_symbol.get(symbol)
+                selected.append([code] if code else [])
+        return intersect(selected)
+
+    def stocks(self, category: str = "", exchange: str = "") -> list[str] | None:
+        with self.__lock:
+            selected = []
+            if category:
+                selected.append(self.__stock_by_category.get(category, []))
+            if exchange:
+                selected.append(self.__stock_by_exchange.get(exchange, []))
+        return intersect(selected)
+
+
+# None means no filter was given
+def intersect(selected: list[list[str]]) -> list[str] | None:
+    if not selected:
+        return None
+    first, rest = selected[0], [set(codes) for codes in selected[1:]]
+    return [code for code in first if all(code in codes for codes in rest)]
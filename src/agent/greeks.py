@@ -0,0 +1,239 @@
+import math
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from shioaji.contracts import Contract
+
+from agent.contract_index import enum_value
+from agent.hub import Hub
+from logger import logger
+
+SECONDS_PER_YEAR = 365 * 86400
+# options settle at the close of the delivery date
+EXPIRY_HOUR, EXPIRY_MINUTE = 13, 30
+MIN_VOL, MAX_VOL = 1e-4, 5.0
+IV_ITERATIONS = 40
+
+
+# abramowitz and stegun 7.1.26, numpy has no vectorized erf
+def erf(x: np.ndarray) -> np.ndarray:
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    result: np.ndarray = sign * (1.0 - poly * np.exp(-x * x))
+    return result
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + erf(x / math.sqrt(2.0)))
+
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    result: np.ndarray = np.exp(-0.5 * x * x) / math.sqrt(2.0 * math.pi)
+    return result
+
+
+def d1_d2(s, k, t, r, vol):
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(s / k) + (r + 0.5 * vol * vol) * t) / (vol * sqrt_t)
+    return d1, d1 - vol * sqrt_t
+
+
+def bs_price(s, k, t, r, vol, is_call):
+    d1, d2 = d1_d2(s, k, t, r, vol)
+    discount = k * np.exp(-r * t)
+    call = s * norm_cdf(d1) - discount * norm_cdf(d2)
+    put = discount * norm_cdf(-d2) - s * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+
+# newton steps guarded by a bisection bracket, prices outside no-arbitrage bounds give nan
+def implied_vol(price, s, k, t, r, is_call) -> np.ndarray:
+    discount = k * np.exp(-r * t)
+    intrinsic = np.where(is_call, np.maximum(s - discount, 0.0), np.maximum(discount - s, 0.0))
+    upper = np.where(is_call, s, discount)
+    valid = (price > intrinsic) & (price < upper) & (s > 0) & (t > 0)
+    lo = np.full(price.shape, MIN_VOL)
+    hi = np.full(price.shape, MAX_VOL)
+    vol = np.full(price.shape, 0.3)
+    with np.errstate(all="ignore"):
+        for _ in range(IV_ITERATIONS):
+            diff = bs_price(s, k, t, r, vol, is_call) - price
+            hi = np.where(diff > 0, vol, hi)
+            lo = np.where(diff <= 0, vol, lo)
+            d1, _ = d1_d2(s, k, t, r, vol)
+            vega = s * norm_pdf(d1) * np.sqrt(t)
+            step = vol - diff / vega
+            bisect = (vega < 1e-8) | ~np.isfinite(step) | (step <= lo) | (step >= hi)
+            vol = np.where(bisect, 0.5 * (lo + hi), step)
+    return np.where(valid, vol, np.nan)
+
+
+@dataclass(frozen=True)
+class ChainGreeks:
+    product: str
+    delivery_month: str
+    underlying_price: float
+    computed_at: datetime
+    codes: list[str]
+    strikes: np.ndarray
+    is_call: np.ndarray
+    price: np.ndarray
+    iv: np.ndarray
+    delta: np.ndarray
+    gamma: np.ndarray
+    vega: np.ndarray
+
+
+# (product, delivery_month, strike_min, strike_max), the strike window is part of the chain
+ChainKey = tuple[str, str, float, float]
+
+
+# one option chain as parallel arrays, quote callbacks write by row
+class ChainArrays:
+    def __init__(self, key: ChainKey, contracts: list[Contract]):
+        contracts = sorted(contracts, key=lambda c: (float(c.strike_price), enum_value(c.option_right)))
+        product, delivery_month, _, _ = key
+        self.key = key
+        self.product = product
+        self.delivery_month = delivery_month
+        self.codes = [c.code for c in contracts]
+        self.rows = {code: i for i, code in enumerate(self.codes)}
+        self.strikes = np.array([float(c.strike_price) for c in contracts])
+        self.is_call = np.array([enum_value(c.option_right) == "C" for c in contracts])
+        self.expiry = np.array([expiry_timestamp(c.delivery_date) for c in contracts])
+        self.last = np.full(len(contracts), np.nan)
+        self.bid = np.full(len(contracts), np.nan)
+        self.ask = np.full(len(contracts), np.nan)
+        self.underlying_price = 0.0
+        self.dirty = False
+        self.refs = 0
+
+
+def expiry_timestamp(delivery_date: str) -> float:
+    date = datetime.strptime(delivery_date.replace("-", "/"), "%Y/%m/%d")
+    return date.replace(hour=EXPIRY_HOUR, minute=EXPIRY_MINUTE).timestamp()
+
+
+# implied vol, delta, gamma and vega per chain, recomputed in one vectorized pass at most once per interval
+# only chains with at least one tracker are kept, results are published on hub keyed by the chain key
+# a code can be a row of several chains, e.g. other strike windows or a product alias of the same contracts
+class OptionGreeks:
+    def __init__(self, interval: float, risk_free_rate: float):
+        self.interval = interval
+        self.risk_free_rate = risk_free_rate
+        self.hub = Hub("greeks")
+        self.__lock = threading.Lock()
+        self.__chains: dict[ChainKey, ChainArrays] = {}
+        # replaced under the lock, quote callbacks read it without locking
+        self.__rows: dict[str, tuple[tuple[ChainArrays, int], ...]] = {}
+        self.__stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.hub.close()
+
+    # returns the codes of the tracked chain, trackers subscribe these so every row has quotes while it lives
+    def track(self, key: ChainKey, contracts: list[Contract]) -> list[str]:
+        with self.__lock:
+            chain = self.__chains.get(key, None)
+            if chain is None:
+                chain = ChainArrays(key, contracts)
+                self.__chains[key] = chain
+                for code, row in chain.rows.items():
+                    self.__rows[code] = self.__rows.get(code, ()) + ((chain, row),)
+            chain.refs += 1
+            return chain.codes
+
+    def untrack(self, key: ChainKey):
+        with self.__lock:
+            chain = self.__chains.get(key, None)
+            if chain is None:
+                return
+            chain.refs -= 1
+            if chain.refs > 0:
+                return
+            del self.__chains[key]
+            for code in chain.codes:
+                remain = tuple(entry for entry in self.__rows.get(code, ()) if entry[0] is not chain)
+                if remain:
+                    self.__rows[code] = remain
+                else:
+                    self.__rows.pop(code, None)
+
+    def update_tick(self, tick):
+        entries = self.__rows.get(tick.code, None)
+        if entries is None:
+            return
+        with self.__lock:
+            for chain, row in entries:
+                chain.last[row] = float(tick.close)
+                if tick.underlying_price > 0:
+                    chain.underlying_price = float(tick.underlying_price)
+                chain.dirty = True
+
+    def update_bidask(self, bidask):
+        entries = self.__rows.get(bidask.code, None)
+        if entries is None:
+            return
+        bid = float(bidask.bid_price[0]) if bidask.bid_price and bidask.bid_price[0] > 0 else np.nan
+        ask = float(bidask.ask_price[0]) if bidask.ask_price and bidask.ask_price[0] > 0 else np.nan
+        with self.__lock:
+            for chain, row in entries:
+                chain.bid[row] = bid
+                chain.ask[row] = ask
+                if bidask.underlying_price > 0:
+                    chain.underlying_price = float(bidask.underlying_price)
+                chain.dirty = True
+
+    def worker(self):
+        while not self.__stopped.wait(self.interval):
+            with self.__lock:
+                dirty = [chain for chain in self.__chains.values() if chain.dirty and chain.underlying_price > 0]
+                inputs = []
+                for chain in dirty:
+                    chain.dirty = False
+                    inputs.append(
+                        (chain, chain.underlying_price, chain.last.copy(), chain.bid.copy(), chain.ask.copy())
+                    )
+            for chain, underlying_price, last, bid, ask in inputs:
+                try:
+                    self.hub.publish(chain.key, self.compute(chain, underlying_price, last, bid, ask))
+                except Exception as e:
+                    logger.error("compute greeks %s %s fail: %s", chain.product, chain.delivery_month, e)
+
+    # mid when both sides are quoted, otherwise last trade
+    def compute(self, chain: ChainArrays, underlying_price: float, last, bid, ask) -> ChainGreeks:
+        now = datetime.now()
+        r = self.risk_free_rate
+        price = np.where(np.isfinite(bid) & np.isfinite(ask), 0.5 * (bid + ask), last)
+        t = np.maximum(chain.expiry - now.timestamp(), 0.0) / SECONDS_PER_YEAR
+        s = np.full(len(chain.codes), underlying_price)
+        iv = implied_vol(price, s, chain.strikes, t, r, chain.is_call)
+        with np.errstate(all="ignore"):
+            d1, _ = d1_d2(s, chain.strikes, t, r, iv)
+            pdf = norm_pdf(d1)
+            delta = np.where(chain.is_call, norm_cdf(d1), norm_cdf(d1) - 1.0)
+            gamma = pdf / (s * iv * np.sqrt(t))
+            # vega per one vol point
+            vega = s * pdf * np.sqrt(t) / 100
+        return ChainGreeks(
+            product=chain.product,
+            delivery_month=chain.delivery_month,
+            underlying_price=underlying_price,
+            computed_at=now,
+            codes=chain.codes,
+            strikes=chain.strikes,
+            is_call=chain.is_call,
+            price=price,
+            iv=iv,
+            delta=delta,
+            gamma=gamma,
+            vega=vega,
+        )
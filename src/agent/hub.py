@@ -0,0 +1,221 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from collections.abc import Hashable
+from queue import ShutDown
+from typing import Any
+
+from config.stream import SlowConsumerPolicy
+
+MAILBOX_ID = itertools.count(1)
+
+
+# bounded per-subscriber buffer, policy is chosen per topic when the item is put:
+# DROP_OLDEST evicts the oldest item when full, CONFLATE overwrites the pending item of the same topic in place,
+# DISCONNECT closes the mailbox when full and kicks the slow subscriber out
+class Mailbox:
+    def __init__(self, size: int):
+        self.id = next(MAILBOX_ID)
+        self.size = max(size, 1)
+        # monotonic ns when the last popped item was put, for latency metrics
+        self.last_put_ns = 0
+        # monotonic ns when the first item of the last batch was put, the oldest one in the batch
+        self.batch_put_ns = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.__cond = threading.Condition(threading.Lock())
+        # [topic, item, put_ns] cells in arrival order, conflated cells are also indexed by topic
+        self.__items: deque[list] = deque()
+        self.__pending: dict[Hashable, list] = {}
+        self.__closed = False
+        # armed by an asyncio consumer, woken thread-safely from the publishing thread
+        self.__waiter: asyncio.Future | None = None
+        self.__waiter_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def put(self, topic: Hashable, item: Any, policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST) -> bool:
+        with self.__cond:
+            if self.__closed:
+                return False
+            if policy is SlowConsumerPolicy.CONFLATE:
+                cell = self.__pending.get(topic, None)
+                if cell is not None:
+                    cell[1] = item
+                    cell[2] = time.monotonic_ns()
+                    self.conflated += 1
+                    return True
+            if len(self.__items) >= self.size:
+                if policy is SlowConsumerPolicy.DISCONNECT:
+                    self.__closed = True
+                    self.__cond.notify_all()
+                    self.__wake()
+                    return False
+                self.__drop(self.__items.popleft())
+                self.dropped += 1
+            cell = [topic, item, time.monotonic_ns()]
+            self.__items.append(cell)
+            if policy is SlowConsumerPolicy.CONFLATE:
+                self.__pending[topic] = cell
+            self.__cond.notify()
+            self.__wake()
+        return True
+
+    def get(self) -> Any:
+        with self.__cond:
+            self.__wait()
+            return self.__pop()[1]
+
+    # block for the first item, then keep draining until max_size items or max_latency seconds
+    def get_batch(self, max_size: int, max_latency: float) -> list[Any]:
+        with self.__cond:
+            self.__wait()
+            batch = [self.__pop()[1]]
+            self.batch_put_ns = self.last_put_ns
+            deadline = time.monotonic() + max_latency
+            while len(batch) < max_size:
+                if self.__items:
+                    batch.append(self.__pop()[1])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.__closed:
+                    break
+                self.__cond.wait(remaining)
+            return batch
+
+    async def aget(self) -> Any:
+        return (await self.aget_with_topic())[1]
+
+    async def aget_with_topic(self) -> tuple[Hashable, Any]:
+        loop = asyncio.get_running_loop()
+        while True:
+            polled = self.__poll(loop)
+            if not isinstance(polled, asyncio.Future):
+                return polled
+            await polled
+
+    async def aget_batch(self, max_size: int, max_latency: float) -> list[Any]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.aget()]
+        self.batch_put_ns = self.last_put_ns
+        deadline = loop.time() + max_latency
+        try:
+            while len(batch) < max_size:
+                polled = self.__poll(loop)
+                if not isinstance(polled, asyncio.Future):
+                    batch.append(polled[1])
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(polled, remaining)
+                except TimeoutError:
+                    break
+        except ShutDown:
+            pass
+        return batch
+
+    # return next (topic, item), or an armed future to await when the mailbox is empty
+    def __poll(self, loop: asyncio.AbstractEventLoop) -> tuple[Hashable, Any] | asyncio.Future:
+        with self.__cond:
+            if self.__closed:
+                raise ShutDown
+            if self.__items:
+                self.__waiter = None
+                return self.__pop()
+            self.__waiter = loop.create_future()
+            self.__waiter_loop = loop
+            return self.__waiter
+
+    def __wake(self):
+        waiter, loop = self.__waiter, self.__waiter_loop
+        if waiter is None or loop is None:
+            return
+        self.__waiter = None
+
+        def resolve():
+            if not waiter.done():
+                waiter.set_result(None)
+
+        try:
+            loop.call_soon_threadsafe(resolve)
+        except RuntimeError:
+            pass
+
+    def __wait(self):
+        while not self.__closed and not self.__items:
+            self.__cond.wait()
+        if self.__closed:
+            raise ShutDown
+
+    def __drop(self, cell: list):
+        if self.__pending.get(cell[0], None) is cell:
+            del self.__pending[cell[0]]
+
+    def __pop(self) -> tuple[Hashable, Any]:
+        cell = self.__items.popleft()
+        self.__drop(cell)
+        self.last_put_ns = cell[2]
+        return cell[0], cell[1]
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__items.clear()
+            self.__pending.clear()
+            self.__cond.notify_all()
+            self.__wake()
+
+
+# broadcast one upstream feed to many mailboxes, keyed by code
+# subscriber tuples are copy-on-write, publish never takes the lock
+# a key is removed as soon as its last mailbox leaves
+class Hub:
+    def __init__(self, name: str):
+        self.name = name
+        self.__lock = threading.Lock()
+        self.__subscribers: dict[Hashable, tuple[tuple[Mailbox, SlowConsumerPolicy], ...]] = {}
+
+    def subscribe(self, key: Hashable, mailbox: Mailbox, policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST):
+        with self.__lock:
+            self.__subscribers[key] = self.__subscribers.get(key, ()) + ((mailbox, policy),)
+
+    def unsubscribe(self, key: Hashable, mailbox: Mailbox) -> int:
+        with self.__lock:
+            remain = tuple(s for s in self.__subscribers.get(key, ()) if s[0] is not mailbox)
+            if remain:
+                self.__subscribers[key] = remain
+            else:
+                self.__subscribers.pop(key, None)
+            return len(remain)
+
+    def subscriber_count(self, key: Hashable) -> int:
+        return len(self.__subscribers.get(key, ()))
+
+    def keys(self) -> list[Hashable]:
+        return list(self.__subscribers)
+
+    def subscribers(self) -> dict[Hashable, list[Mailbox]]:
+        with self.__lock:
+            return {key: [mailbox for mailbox, _ in entries] for key, entries in self.__subscribers.items()}
+
+    def publish(self, key: Hashable, item: Any):
+        for mailbox, policy in self.__subscribers.get(key, ()):
+            if not mailbox.put((self.name, key), item, policy):
+                self.unsubscribe(key, mailbox)
+
+    def close(self):
+        with self.__lock:
+            subscribers = self.__subscribers
+            self.__subscribers = {}
+        for entries in subscribers.values():
+            for mailbox, _ in entries:
+                mailbox.close()
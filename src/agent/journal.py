@@ -0,0 +1,258 @@
+import mmap
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime
+from queue import Empty, SimpleQueue
+from typing import Any, BinaryIO, Iterator
+
+import msgpack
+
+from agent.record import (
+    BODY,
+    DECODER,
+    ENCODER,
+    KIND_BIDASK,
+    KIND_TICK,
+)
+from agent.snapshot import trading_date
+from logger import logger
+
+# record layout, every record starts with kind and code id
+# kind 0 registers a code id, kind 1 is a fop tick, kind 2 is a fop bidask
+KIND_CODE = 0
+HEADER = struct.Struct("<BH")
+CODE_LENGTH = struct.Struct("<B")
+
+INDEX_FLUSH_INTERVAL = 5
+WRITE_BATCH_SIZE = 4096
+
+
+def journal_path(directory: str, date: str) -> tuple[str, str]:
+    return os.path.join(directory, f"{date}.journal"), os.path.join(directory, f"{date}.idx")
+
+
+# trading dates are YYYY-MM-DD, anything else must not reach journal_path
+def valid_journal_date(date: str) -> bool:
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d") == date
+    except ValueError:
+        return False
+
+
+# one msgpack chunk is appended to the index per flush, with the codes and offsets added since the last one
+# size is the journal size the chunk covers, code_start the id of its first new code
+def index_chunk(size: int, code_start: int, codes: list[str], index: dict[int, dict[str, array]]) -> bytes:
+    chunk: bytes = msgpack.packb(
+        {
+            "size": size,
+            "code_start": code_start,
+            "codes": codes,
+            "index": {
+                kind: {code: offsets.tobytes() for code, offsets in entries.items()} for kind, entries in index.items()
+            },
+        }
+    )
+    return chunk
+
+
+def empty_index() -> dict[int, dict[str, array]]:
+    return {KIND_TICK: {}, KIND_BIDASK: {}}
+
+
+# append-only per-trading-date quote journal, callbacks only enqueue,
+# encoding and disk writes happen on the writer thread
+# the index only grows by the offsets written since the last flush, it is rewritten once when a journal is reopened
+class Journal:
+    def __init__(self, directory: str = os.path.join("data", "journal")):
+        self.directory = directory
+        self.__queue: SimpleQueue = SimpleQueue()
+        self.__thread: threading.Thread | None = None
+        self.__date = ""
+        self.__file: BinaryIO | None = None
+        self.__index_file: BinaryIO | None = None
+        self.__offset = 0
+        self.__codes: dict[str, int] = {}
+        self.__flushed_codes = 0
+        self.__flushed_offset = 0
+        self.__pending: dict[int, dict[str, array]] = empty_index()
+
+    def start(self):
+        if self.__thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__queue.put(None)
+        self.__thread.join(timeout=5)
+        self.__thread = None
+
+    def append(self, kind: int, quote):
+        self.__queue.put((kind, quote))
+
+    def __run(self):
+        flushed_at = datetime.now()
+        while True:
+            try:
+                item = self.__queue.get(timeout=INDEX_FLUSH_INTERVAL)
+            except Empty:
+                item = ()
+            batch = [item]
+            while item is not None and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self.__queue.get_nowait()
+                    batch.append(item)
+                except Empty:
+                    break
+            try:
+                self.__write([i for i in batch if i])
+                if None in batch or (datetime.now() - flushed_at).total_seconds() >= INDEX_FLUSH_INTERVAL:
+                    self.__flush_index()
+                    flushed_at = datetime.now()
+            except Exception as e:
+                logger.error("journal write fail: %s", e)
+            if None in batch:
+                self.__close()
+                return
+
+    def __rotate(self) -> BinaryIO:
+        date = trading_date()
+        if date == self.__date and self.__file is not None:
+            return self.__file
+        self.__close()
+        data_path, index_path = journal_path(self.directory, date)
+        self.__date = date
+        self.__codes = {}
+        self.__pending = empty_index()
+        index = index_chunk(0, 0, [], empty_index())
+        if os.path.exists(data_path):
+            reader = JournalReader(self.directory, date)
+            self.__codes = {code: i for i, code in enumerate(reader.codes)}
+            # a crash can leave a partial record at the end, appends start after the last complete one
+            if reader.size < os.path.getsize(data_path):
+                logger.warning("journal %s truncated to %d bytes", data_path, reader.size)
+                os.truncate(data_path, reader.size)
+            index = index_chunk(reader.size, 0, reader.codes, reader.index)
+        # compacted into one chunk, this also drops a partial chunk left by a crash during a flush
+        with open(f"{index_path}.tmp", "wb") as file:
+            file.write(index)
+        os.replace(f"{index_path}.tmp", index_path)
+        self.__index_file = open(index_path, "ab")
+        file = open(data_path, "ab")
+        self.__file = file
+        self.__offset = file.tell()
+        self.__flushed_codes = len(self.__codes)
+        self.__flushed_offset = self.__offset
+        logger.info("journal open: %s", data_path)
+        return file
+
+    def __write(self, batch: list):
+        if not batch:
+            return
+        file = self.__rotate()
+        buffer = bytearray()
+        for kind, quote in batch:
+            code_id = self.__codes.get(quote.code, None)
+            if code_id is None:
+                code_id = len(self.__codes)
+                self.__codes[quote.code] = code_id
+                code = quote.code.encode()
+                buffer += HEADER.pack(KIND_CODE, code_id) + CODE_LENGTH.pack(len(code)) + code
+            offset = self.__offset + len(buffer)
+            self.__pending[kind].setdefault(quote.code, array("q")).append(offset)
+            buffer += HEADER.pack(kind, code_id) + ENCODER[kind](quote)
+        file.write(buffer)
+        self.__offset += len(buffer)
+
+    # records are flushed before the chunk that points at them
+    def __flush_index(self):
+        if self.__file is None or self.__index_file is None or self.__offset == self.__flushed_offset:
+            return
+        self.__file.flush()
+        codes = sorted(self.__codes, key=self.__codes.__getitem__)[self.__flushed_codes :]
+        self.__index_file.write(index_chunk(self.__offset, self.__flushed_codes, codes, self.__pending))
+        self.__index_file.flush()
+        self.__pending = empty_index()
+        self.__flushed_codes = len(self.__codes)
+        self.__flushed_offset = self.__offset
+
+    def __close(self):
+        if self.__file is None or self.__index_file is None:
+            return
+        self.__flush_index()
+        self.__file.close()
+        self.__index_file.close()
+        self.__file = None
+        self.__index_file = None
+
+
+# read a journal through mmap, the index chunks are folded in order and the records after the last
+# chunk that fits the file are scanned
+# folding stops at a partial chunk from a crash during a flush, or a chunk past the end of the journal
+# size is the end of the last complete record, the scan stops at a short or corrupt one
+class JournalReader:
+    def __init__(self, directory: str, date: str):
+        data_path, index_path = journal_path(directory, date)
+        self.codes: list[str] = []
+        self.index: dict[int, dict[str, array]] = empty_index()
+        self.__buffer: Any = b""
+        size = os.path.getsize(data_path)
+        if size > 0:
+            with open(data_path, "rb") as file:
+                self.__buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        covered = 0
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as file:
+                covered = self.__fold(msgpack.Unpacker(file, strict_map_key=False), size)
+        self.size = self.__scan(covered, size)
+
+    def __fold(self, chunks: msgpack.Unpacker, size: int) -> int:
+        covered = 0
+        try:
+            for chunk in chunks:
+                if chunk["size"] > size or chunk["code_start"] != len(self.codes):
+                    break
+                # decoded in full before anything is applied, a corrupt chunk leaves the index as it was
+                codes = [str(code) for code in chunk["codes"]]
+                entries = [
+                    (self.index[kind], code, array("q", offsets))
+                    for kind, offsets_by_code in chunk["index"].items()
+                    for code, offsets in offsets_by_code.items()
+                ]
+                self.codes.extend(codes)
+                for index, code, offsets in entries:
+                    index.setdefault(code, array("q")).extend(offsets)
+                covered = chunk["size"]
+        except (KeyError, TypeError, ValueError, msgpack.UnpackException) as e:
+            logger.warning("journal index stopped at %d bytes: %s", covered, e)
+        return covered
+
+    def __scan(self, offset: int, size: int) -> int:
+        while offset + HEADER.size <= size:
+            kind, code_id = HEADER.unpack_from(self.__buffer, offset)
+            if kind == KIND_CODE:
+                start = offset + HEADER.size + CODE_LENGTH.size
+                if start > size:
+                    break
+                (length,) = CODE_LENGTH.unpack_from(self.__buffer, offset + HEADER.size)
+                if start + length > size:
+                    break
+                if code_id == len(self.codes):
+                    self.codes.append(bytes(self.__buffer[start : start + length]).decode())
+                offset = start + length
+                continue
+            if kind not in BODY or code_id >= len(self.codes) or offset + HEADER.size + BODY[kind].size > size:
+                break
+            self.index[kind].setdefault(self.codes[code_id], array("q")).append(offset)
+            offset += HEADER.size + BODY[kind].size
+        return offset
+
+    def records(self, kind: int, code: str) -> Iterator[Any]:
+        decode = DECODER[kind]
+        for offset in self.index[kind].get(code, ()):
+            yield decode(code, self.__buffer, offset + HEADER.size)
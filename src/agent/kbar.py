@@ -0,0 +1,132 @@
+import threading
+from array import array
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+
+from agent.hub import Hub
+from agent.record import EPOCH, datetime_to_ns
+from agent.snapshot import trading_date
+
+NS_PER_SECOND = 1_000_000_000
+
+
+@dataclass
+class Kbar:
+    code: str
+    interval: int
+    start: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int = 0
+    amount: float = 0.0
+    closed: bool = False
+
+    @property
+    def start_time(self) -> datetime:
+        return EPOCH + timedelta(seconds=self.start)
+
+    @property
+    def vwap(self) -> float:
+        return self.amount / self.volume if self.volume > 0 else self.close
+
+
+# closed bars of one code and interval as typed columns, 56 bytes per bar
+class ClosedBars:
+    def __init__(self):
+        self.start = array("q")
+        self.open = array("d")
+        self.high = array("d")
+        self.low = array("d")
+        self.close = array("d")
+        self.volume = array("q")
+        self.amount = array("d")
+
+    def append(self, bar: Kbar):
+        self.start.append(bar.start)
+        self.open.append(bar.open)
+        self.high.append(bar.high)
+        self.low.append(bar.low)
+        self.close.append(bar.close)
+        self.volume.append(bar.volume)
+        self.amount.append(bar.amount)
+
+    def bars(self, code: str, interval: int) -> list[Kbar]:
+        return [
+            Kbar(code, interval, start, open_price, high, low, close, volume, amount, closed=True)
+            for start, open_price, high, low, close, volume, amount in zip(
+                self.start, self.open, self.high, self.low, self.close, self.volume, self.amount
+            )
+        ]
+
+
+# incremental ohlcv bars per code and interval (seconds), built from fop ticks
+# bar start is wall clock seconds since epoch
+# every update and every closed bar is published on hub keyed by (code, interval)
+class KbarBuilder:
+    def __init__(self, intervals: list[int]):
+        self.intervals = sorted(set(intervals))
+        self.hub = Hub("kbar")
+        self.__lock = threading.Lock()
+        self.__date = ""
+        self.__current: dict[tuple[str, int], Kbar] = {}
+        self.__closed: dict[tuple[str, int], ClosedBars] = {}
+
+    # simulated trial-match ticks are not trades, same as the tick store
+    def update(self, tick):
+        if tick.simtrade:
+            return
+        seconds = datetime_to_ns(tick.datetime) // NS_PER_SECOND
+        price = float(tick.close)
+        volume = int(tick.volume)
+        with self.__lock:
+            for interval in self.intervals:
+                key = (tick.code, interval)
+                start = seconds - seconds % interval
+                bar = self.__current.get(key, None)
+                if bar is not None and bar.start != start:
+                    self.__close(key, bar)
+                    bar = None
+                if bar is None:
+                    bar = Kbar(tick.code, interval, start, price, price, price, price)
+                    self.__current[key] = bar
+                bar.high = max(bar.high, price)
+                bar.low = min(bar.low, price)
+                bar.close = price
+                bar.volume += volume
+                bar.amount += price * volume
+                if self.hub.subscriber_count(key) > 0:
+                    self.hub.publish(key, replace(bar))
+
+    def __close(self, key: tuple[str, int], bar: Kbar):
+        bar.closed = True
+        date = trading_date(bar.start_time)
+        if date != self.__date:
+            if self.__date != "":
+                self.__closed = {}
+            self.__date = date
+        closed = self.__closed.get(key, None)
+        if closed is None:
+            closed = ClosedBars()
+            self.__closed[key] = closed
+        closed.append(bar)
+        if self.hub.subscriber_count(key) > 0:
+            self.hub.publish(key, replace(bar))
+
+    # bar in progress, a copy
+    def current(self, code: str, interval: int) -> Kbar | None:
+        with self.__lock:
+            bar = self.__current.get((code, interval), None)
+            return replace(bar) if bar is not None else None
+
+    # completed bars of today plus the bar in progress
+    def snapshot(self, code: str, interval: int) -> list[Kbar]:
+        key = (code, interval)
+        with self.__lock:
+            closed = self.__closed.get(key, None)
+            bars = closed.bars(code, interval) if closed is not None else []
+            current = self.__current.get(key, None)
+            if current is not None:
+                bars.append(replace(current))
+            return bars
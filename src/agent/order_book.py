@@ -0,0 +1,234 @@
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Callable
+
+import shioaji.constant as sc
+from shioaji.order import Trade
+
+OP_CODE_OK = "00"
+EVENT_ORDER, EVENT_DEAL, EVENT_RECONCILE, EVENT_SNAPSHOT = "order", "deal", "reconcile", "snapshot"
+
+# order status only moves forward, final states share the highest rank
+STATUS_RANK = {
+    sc.Status.Inactive.value: 0,
+    sc.Status.PendingSubmit.value: 1,
+    sc.Status.PreSubmitted.value: 2,
+    sc.Status.Submitted.value: 3,
+    sc.Status.PartFilled.value: 4,
+    sc.Status.Filled.value: 5,
+    sc.Status.Cancelled.value: 5,
+    sc.Status.Failed.value: 5,
+}
+
+
+@dataclass(frozen=True)
+class DealRecord:
+    seq: str
+    price: float
+    quantity: int
+    ts: float
+
+
+@dataclass(frozen=True)
+class OrderRecord:
+    id: str
+    seqno: str
+    ordno: str
+    code: str
+    security_type: str
+    action: str
+    price: float
+    quantity: int
+    status: str
+    deal_quantity: int = 0
+    cancel_quantity: int = 0
+    deals: tuple[DealRecord, ...] = field(default_factory=tuple)
+    client_order_id: str = ""
+
+    @property
+    def remaining(self) -> int:
+        return self.quantity - self.deal_quantity - self.cancel_quantity
+
+    # how far the order has progressed, a record never replaces one that is further along
+    @property
+    def progress(self) -> tuple[int, int, int]:
+        return self.deal_quantity, self.cancel_quantity, STATUS_RANK.get(self.status, 0)
+
+    @classmethod
+    def from_trade(cls, trade: Trade) -> "OrderRecord":
+        return cls(
+            id=trade.order.id,
+            seqno=trade.order.seqno,
+            ordno=trade.order.ordno,
+            code=trade.contract.code,
+            security_type=str(trade.contract.security_type.value),
+            action=str(trade.order.action.value),
+            price=trade.status.modified_price or trade.order.price,
+            quantity=trade.order.quantity,
+            status=str(trade.status.status.value),
+            deal_quantity=trade.status.deal_quantity,
+            cancel_quantity=trade.status.cancel_quantity,
+            deals=tuple(
+                DealRecord(seq=deal.seq, price=deal.price, quantity=deal.quantity, ts=deal.ts)
+                for deal in trade.status.deals or []
+            ),
+            client_order_id=trade.order.custom_field or "",
+        )
+
+
+@dataclass(frozen=True)
+class OrderEvent:
+    seq: int
+    kind: str
+    record: OrderRecord
+
+
+# order state machine fed by order callback payloads, keyed by order id (deal trade_id is the order id)
+# records are immutable and only replaced under the write lock, readers never lock
+# every change gets the next sequence number, recent events are kept so a client can resume with deltas
+# seq restarts with the process, epoch tells clients which process issued it
+class OrderBook:
+    def __init__(self, history_size: int = 4096, on_event: Callable[[OrderEvent], None] | None = None):
+        self.__write_lock = threading.Lock()
+        self.__orders: dict[str, OrderRecord] = {}
+        self.__seq = 0
+        self.epoch = uuid.uuid4().hex
+        self.__history: deque[OrderEvent] = deque(maxlen=history_size)
+        self.on_event = on_event
+
+    def get(self, order_id: str) -> OrderRecord | None:
+        return self.__orders.get(order_id, None)
+
+    def get_all(self) -> list[OrderRecord]:
+        return list(self.__orders.values())
+
+    @property
+    def seq(self) -> int:
+        return self.__seq
+
+    # trades are fetched outside the lock, since_seq is the book seq before the fetch started
+    # callbacks applied during the fetch win when they are further along than the fetched record
+    # local only orders are dropped unless they changed during the fetch
+    # only records that differ from the local state are emitted
+    def reconcile(self, trades: list[Trade], since_seq: int = 0):
+        fetched = {trade.order.id: OrderRecord.from_trade(trade) for trade in trades}
+        with self.__write_lock:
+            previous = self.__orders
+            if self.__history and self.__history[0].seq <= since_seq + 1:
+                changed = {event.record.id for event in self.__history if event.seq > since_seq}
+            else:
+                changed = set(previous)
+            orders = {order_id: previous[order_id] for order_id in changed if order_id in previous}
+            for order_id, record in fetched.items():
+                local = previous.get(order_id, None)
+                if local is not None and local.progress > record.progress:
+                    orders[order_id] = local
+                    continue
+                orders[order_id] = record
+                if local != record:
+                    self.__emit(record, EVENT_RECONCILE)
+            self.__orders = orders
+
+    # failed non-blocking submits never reach the order callback
+    # they may have no order id yet and are keyed by the client order id instead
+    def reject(self, record: OrderRecord):
+        if record.id == "":
+            if record.client_order_id == "":
+                return
+            record = replace(record, id=record.client_order_id)
+        with self.__write_lock:
+            if record.id in self.__orders:
+                return
+            self.__store(record, EVENT_ORDER)
+
+    # deltas after last_seq when still in history and issued by this process, otherwise a snapshot of every order
+    # returns (seq, events, is_snapshot)
+    def resume(self, last_seq: int, epoch: str = "") -> tuple[int, list[OrderEvent], bool]:
+        with self.__write_lock:
+            seq = self.__seq
+            if (
+                epoch == self.epoch
+                and 0 < last_seq <= seq
+                and (last_seq == seq or self.__history[0].seq <= last_seq + 1)
+            ):
+                return seq, [event for event in self.__history if event.seq > last_seq], False
+            return seq, [OrderEvent(seq, EVENT_SNAPSHOT, record) for record in self.__orders.values()], True
+
+    # return False when the event cannot be applied and a full reconciliation is needed
+    def apply(self, order_state: sc.OrderState, res: dict) -> bool:
+        with self.__write_lock:
+            if order_state in (sc.OrderState.FuturesOrder, sc.OrderState.StockOrder):
+                return self.__apply_order(res)
+            if order_state in (sc.OrderState.FuturesDeal, sc.OrderState.StockDeal):
+                return self.__apply_deal(res)
+            return True
+
+    def __apply_order(self, res: dict) -> bool:
+        operation, order, status = res["operation"], res["order"], res["status"]
+        record = self.__orders.get(order["id"], None)
+        failed = operation["op_code"] != OP_CODE_OK
+        if operation["op_type"] == "New":
+            if record is not None:
+                return True
+            record = OrderRecord(
+                id=order["id"],
+                seqno=order["seqno"],
+                ordno=order["ordno"],
+                code=res["contract"]["code"],
+                security_type=res["contract"]["security_type"],
+                action=order["action"],
+                price=order["price"],
+                quantity=order["quantity"],
+                status=sc.Status.Failed.value if failed else sc.Status.Submitted.value,
+                client_order_id=order.get("custom_field", None) or "",
+            )
+        elif record is None:
+            return False
+        elif failed:
+            return True
+        elif operation["op_type"] == "Cancel":
+            record = replace(
+                record,
+                cancel_quantity=status.get("cancel_quantity", record.remaining + record.cancel_quantity),
+                status=sc.Status.Cancelled.value,
+            )
+        elif operation["op_type"] == "UpdatePrice":
+            record = replace(record, price=status.get("modified_price", order["price"]))
+        elif operation["op_type"] == "UpdateQty":
+            record = replace(record, cancel_quantity=status.get("cancel_quantity", record.cancel_quantity))
+        self.__store(record, EVENT_ORDER)
+        return True
+
+    def __apply_deal(self, res: dict) -> bool:
+        record = self.__orders.get(res["trade_id"], None)
+        if record is None:
+            return False
+        seq = str(res.get("exchange_seq", res["seqno"]))
+        if any(deal.seq == seq for deal in record.deals):
+            return True
+        deal_quantity = record.deal_quantity + res["quantity"]
+        record = replace(
+            record,
+            deal_quantity=deal_quantity,
+            deals=record.deals + (DealRecord(seq=seq, price=res["price"], quantity=res["quantity"], ts=res["ts"]),),
+            status=(
+                sc.Status.Filled.value
+                if deal_quantity >= record.quantity - record.cancel_quantity
+                else sc.Status.PartFilled.value
+            ),
+        )
+        self.__store(record, EVENT_DEAL)
+        return True
+
+    def __store(self, record: OrderRecord, kind: str):
+        self.__orders[record.id] = record
+        self.__emit(record, kind)
+
+    def __emit(self, record: OrderRecord, kind: str):
+        self.__seq += 1
+        event = OrderEvent(self.__seq, kind, record)
+        self.__history.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
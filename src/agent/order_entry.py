@@ -0,0 +1,164 @@
+import itertools
+import random
+import threading
+from typing import Callable
+
+import shioaji as sj
+import shioaji.constant as sc
+from shioaji.contracts import Contract
+from shioaji.order import Trade
+
+from logger import logger
+
+# timeout 0 is shioaji non-blocking mode, the result arrives on the order callback
+NON_BLOCKING = 0
+
+# shioaji custom_field is at most 6 alphanumeric characters
+CLIENT_ORDER_ID_SIZE = 6
+BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def base36(value: int, size: int) -> str:
+    digits = []
+    for _ in range(size):
+        value, digit = divmod(value, 36)
+        digits.append(BASE36[digit])
+    return "".join(reversed(digits))
+
+
+def valid_client_order_id(client_order_id: str) -> bool:
+    return 0 < len(client_order_id) <= CLIENT_ORDER_ID_SIZE and client_order_id.isascii() and client_order_id.isalnum()
+
+
+# order argument templates per account, enum lookups and account binding are done once
+# a shioaji Order is a pydantic model validated on construction, only price and quantity change per order
+# trades placed here are kept by order id so modify and cancel skip list_trades
+# non-blocking trades have no order id until the callback, they are tracked by a client order id
+# carried in custom_field, generated ids are a random per-process prefix and a counter
+class OrderEntry:
+    def __init__(self, api: sj.Shioaji, result_callback: Callable[[Trade], None]):
+        self.__api = api
+        self.__result_callback = result_callback
+        self.__templates: dict[tuple, dict] = {}
+        self.__trades_lock = threading.Lock()
+        self.__trades: dict[str, Trade] = {}
+        # client order id to the trade returned by place, None while place_order is in flight
+        self.__pending: dict[str, Trade | None] = {}
+        self.__order_ids: dict[str, str] = {}
+        self.__prefix = base36(random.randrange(36**2), 2)
+        self.__counter = itertools.count(1)
+        for action in ("Buy", "Sell"):
+            for price_type in ("LMT", "MKT", "MKP"):
+                for order_type in ("ROD", "IOC", "FOK"):
+                    for octype in ("Auto", "New", "Cover", "DayTrade"):
+                        self.future_template(action, price_type, order_type, octype)
+
+    def future_template(self, action: str, price_type: str, order_type: str, octype: str) -> dict:
+        key = ("future", action, price_type, order_type, octype)
+        template = self.__templates.get(key, None)
+        if template is None:
+            template = {
+                "action": sc.Action(action),
+                "price_type": sc.FuturesPriceType(price_type),
+                "order_type": sc.OrderType(order_type),
+                "octype": sc.FuturesOCType(octype or sc.FuturesOCType.Auto.value),
+                "account": self.__api.futopt_account,
+            }
+            self.__templates[key] = template
+        return template
+
+    def stock_template(self, action: str, price_type: str, order_type: str, order_lot: str, order_cond: str) -> dict:
+        key = ("stock", action, price_type, order_type, order_lot, order_cond)
+        template = self.__templates.get(key, None)
+        if template is None:
+            template = {
+                "action": sc.Action(action),
+                "price_type": sc.StockPriceType(price_type),
+                "order_type": sc.OrderType(order_type),
+                "order_lot": sc.StockOrderLot(order_lot or sc.StockOrderLot.Common.value),
+                "order_cond": sc.StockOrderCond(order_cond or sc.StockOrderCond.Cash.value),
+                "account": self.__api.stock_account,
+            }
+            self.__templates[key] = template
+        return template
+
+    def next_client_order_id(self) -> str:
+        return self.__prefix + base36(next(self.__counter), CLIENT_ORDER_ID_SIZE - len(self.__prefix))
+
+    # client_order_id is reserved before place_order so concurrent places cannot share it
+    def place(
+        self, contract: Contract, template: dict, price: float, quantity: int, client_order_id: str = ""
+    ) -> Trade:
+        if client_order_id == "":
+            client_order_id = self.next_client_order_id()
+        elif not valid_client_order_id(client_order_id):
+            raise ValueError(f"client order id {client_order_id} is not 1-{CLIENT_ORDER_ID_SIZE} alphanumerics")
+        with self.__trades_lock:
+            if client_order_id in self.__pending or client_order_id in self.__order_ids:
+                raise ValueError(f"client order id {client_order_id} already used")
+            self.__pending[client_order_id] = None
+        try:
+            trade = self.__api.place_order(
+                contract,
+                sj.Order(price=price, quantity=quantity, custom_field=client_order_id, **template),
+                timeout=NON_BLOCKING,
+                cb=self.callback,
+            )
+        except Exception:
+            with self.__trades_lock:
+                self.__pending.pop(client_order_id, None)
+            raise
+        self.__remember(trade)
+        return trade
+
+    # zero price or quantity leaves that field unchanged
+    def update(self, trade: Trade, price: float, quantity: int):
+        self.__api.update_order(
+            trade, price=price or None, qty=quantity or None, timeout=NON_BLOCKING, cb=self.callback
+        )
+
+    def cancel(self, trade: Trade):
+        self.__api.cancel_order(trade, timeout=NON_BLOCKING, cb=self.callback)
+
+    # order_id is either the shioaji order id or the client order id of an acknowledged order
+    def cached(self, order_id: str) -> Trade | None:
+        with self.__trades_lock:
+            return self.__trades.get(self.__order_ids.get(order_id, order_id), None)
+
+    # placed here but not acknowledged yet, cannot be modified or cancelled
+    def is_pending(self, client_order_id: str) -> bool:
+        with self.__trades_lock:
+            return client_order_id in self.__pending
+
+    # orders placed before start or by other clients, blocks on shioaji
+    def trade(self, order_id: str) -> Trade | None:
+        trade = self.cached(order_id)
+        if trade is not None:
+            return trade
+        self.__api.update_status()
+        for trade in self.__api.list_trades():
+            self.__remember(trade)
+        return self.cached(order_id)
+
+    def callback(self, trade: Trade):
+        self.__remember(trade)
+        try:
+            self.__result_callback(trade)
+        except Exception as e:
+            logger.error("order result callback fail: %s", e)
+
+    def __remember(self, trade: Trade):
+        client_order_id = trade.order.custom_field or ""
+        with self.__trades_lock:
+            if trade.order.id == "":
+                # rejected before the exchange assigned an id, the client order id can be reused
+                if trade.status.status == sc.Status.Failed:
+                    self.__pending.pop(client_order_id, None)
+                elif client_order_id in self.__pending:
+                    self.__pending[client_order_id] = trade
+                return
+            self.__trades[trade.order.id] = trade
+            # the callback can arrive before place_order returns, while the pending value is still None
+            if client_order_id in self.__pending:
+                del self.__pending[client_order_id]
+                self.__order_ids[client_order_id] = trade.order.id
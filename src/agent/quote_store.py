@@ -0,0 +1,121 @@
+import threading
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+
+from agent.record import datetime_to_ns, ns_to_datetime
+
+# per-code row of doubles, overwritten in place by the quote callbacks
+FIELDS = (
+    "close",
+    "open",
+    "high",
+    "low",
+    "volume",
+    "total_volume",
+    "underlying_price",
+    "price_chg",
+    "pct_chg",
+    "bid_price",
+    "bid_volume",
+    "ask_price",
+    "ask_volume",
+)
+WIDTH = len(FIELDS)
+TICK_TS, BIDASK_TS = 0, 1
+
+
+@dataclass(frozen=True)
+class LatestQuote:
+    code: str
+    tick_time: datetime | None
+    bidask_time: datetime | None
+    close: float
+    open: float
+    high: float
+    low: float
+    volume: float
+    total_volume: float
+    underlying_price: float
+    price_chg: float
+    pct_chg: float
+    bid_price: float
+    bid_volume: float
+    ask_price: float
+    ask_volume: float
+
+
+class QuoteStore:
+    def __init__(self, capacity: int = 1024):
+        self.__lock = threading.Lock()
+        self.__slots: dict[str, int] = {}
+        self.__capacity = capacity
+        self.__values = array("d", bytes(8 * WIDTH * capacity))
+        self.__times = array("q", bytes(8 * 2 * capacity))
+
+    def __slot(self, code: str) -> int:
+        slot = self.__slots.get(code, None)
+        if slot is None:
+            slot = len(self.__slots)
+            if slot >= self.__capacity:
+                self.__values.extend(array("d", bytes(8 * WIDTH * self.__capacity)))
+                self.__times.extend(array("q", bytes(8 * 2 * self.__capacity)))
+                self.__capacity *= 2
+            self.__slots[code] = slot
+        return slot
+
+    def update_tick(self, tick):
+        ts = datetime_to_ns(tick.datetime)
+        with self.__lock:
+            slot = self.__slot(tick.code)
+            base = slot * WIDTH
+            self.__values[base : base + 9] = array(
+                "d",
+                (
+                    float(tick.close),
+                    float(tick.open),
+                    float(tick.high),
+                    float(tick.low),
+                    tick.volume,
+                    tick.total_volume,
+                    float(getattr(tick, "underlying_price", 0)),
+                    float(tick.price_chg),
+                    float(tick.pct_chg),
+                ),
+            )
+            self.__times[slot * 2 + TICK_TS] = ts
+
+    def update_bidask(self, bidask):
+        ts = datetime_to_ns(bidask.datetime)
+        with self.__lock:
+            slot = self.__slot(bidask.code)
+            base = slot * WIDTH + 9
+            self.__values[base : base + 4] = array(
+                "d",
+                (
+                    float(bidask.bid_price[0]) if bidask.bid_price else 0,
+                    bidask.bid_volume[0] if bidask.bid_volume else 0,
+                    float(bidask.ask_price[0]) if bidask.ask_price else 0,
+                    bidask.ask_volume[0] if bidask.ask_volume else 0,
+                ),
+            )
+            self.__times[slot * 2 + BIDASK_TS] = ts
+
+    def get(self, codes: list[str]) -> list[LatestQuote]:
+        result = []
+        with self.__lock:
+            for code in codes:
+                slot = self.__slots.get(code, None)
+                if slot is None:
+                    continue
+                row = self.__values[slot * WIDTH : (slot + 1) * WIDTH]
+                tick_ts, bidask_ts = self.__times[slot * 2], self.__times[slot * 2 + 1]
+                result.append(
+                    LatestQuote(
+                        code,
+                        ns_to_datetime(tick_ts) if tick_ts else None,
+                        ns_to_datetime(bidask_ts) if bidask_ts else None,
+                        *row,
+                    )
+                )
+        return result
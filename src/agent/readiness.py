@@ -0,0 +1,44 @@
+import threading
+
+from logger import logger
+
+# startup stages, rpcs check the stages they depend on instead of waiting for the whole login
+STAGE_SESSION = "session"
+STAGE_CONTRACTS = "contracts"
+STAGE_CA = "ca"
+STAGE_ORDERS = "orders"
+STAGES = (STAGE_SESSION, STAGE_CONTRACTS, STAGE_CA, STAGE_ORDERS)
+
+
+class Readiness:
+    def __init__(self):
+        self.__events = {stage: threading.Event() for stage in STAGES}
+        # stages that do not apply to this process, e.g. orders on a quote only session
+        self.__skipped: set[str] = set()
+        self.error = ""
+
+    def set(self, stage: str):
+        if not self.__events[stage].is_set():
+            self.__events[stage].set()
+            logger.info("%s ready", stage)
+
+    def skip(self, stage: str):
+        self.__skipped.add(stage)
+        logger.info("%s not applicable", stage)
+
+    def is_skipped(self, stage: str) -> bool:
+        return stage in self.__skipped
+
+    def is_ready(self, *stages: str) -> bool:
+        return all(self.__events[stage].is_set() for stage in stages)
+
+    # blocks without spinning, returns False on timeout
+    def wait(self, stage: str, timeout: float | None = None) -> bool:
+        return self.__events[stage].wait(timeout)
+
+    def fail(self, error: str):
+        self.error = error
+
+    # skipped stages are left out
+    def status(self) -> dict[str, bool]:
+        return {stage: event.is_set() for stage, event in self.__events.items() if stage not in self.__skipped}
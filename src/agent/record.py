@@ -0,0 +1,152 @@
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+# fixed layout fop tick and bidask bodies shared by the journal and the shm rings
+# stdlib only so client side readers can import it without titan dependencies
+KIND_TICK = 1
+KIND_BIDASK = 2
+
+BIDASK_LEVEL = 5
+TICK_BODY = struct.Struct("<q10d4q3B")
+BIDASK_BODY = struct.Struct(
+    f"<q2q{BIDASK_LEVEL}d{BIDASK_LEVEL}q{BIDASK_LEVEL}q{BIDASK_LEVEL}d{BIDASK_LEVEL}q{BIDASK_LEVEL}q3d2qB"
+)
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def datetime_to_ns(value: datetime) -> int:
+    return (value.replace(tzinfo=None) - EPOCH) // MICROSECOND * 1000
+
+
+def ns_to_datetime(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value // 1000)
+
+
+def levels(values: list, default: Any) -> list:
+    return (list(values) + [default] * BIDASK_LEVEL)[:BIDASK_LEVEL]
+
+
+# decoded journal records keep the attribute names of TickFOPv1/BidAskFOPv1
+@dataclass(frozen=True)
+class JournalTick:
+    code: str
+    datetime: datetime
+    open: float
+    underlying_price: float
+    avg_price: float
+    close: float
+    high: float
+    low: float
+    amount: float
+    total_amount: float
+    price_chg: float
+    pct_chg: float
+    bid_side_total_vol: int
+    ask_side_total_vol: int
+    volume: int
+    total_volume: int
+    tick_type: int
+    chg_type: int
+    simtrade: bool
+
+
+@dataclass(frozen=True)
+class JournalBidAsk:
+    code: str
+    datetime: datetime
+    bid_total_vol: int
+    ask_total_vol: int
+    bid_price: list[float]
+    bid_volume: list[int]
+    diff_bid_vol: list[int]
+    ask_price: list[float]
+    ask_volume: list[int]
+    diff_ask_vol: list[int]
+    first_derived_bid_price: float
+    first_derived_ask_price: float
+    underlying_price: float
+    first_derived_bid_vol: int
+    first_derived_ask_vol: int
+    simtrade: bool
+
+
+def encode_tick(tick) -> bytes:
+    return TICK_BODY.pack(
+        datetime_to_ns(tick.datetime),
+        float(tick.open),
+        float(tick.underlying_price),
+        float(tick.avg_price),
+        float(tick.close),
+        float(tick.high),
+        float(tick.low),
+        float(tick.amount),
+        float(tick.total_amount),
+        float(tick.price_chg),
+        float(tick.pct_chg),
+        tick.bid_side_total_vol,
+        tick.ask_side_total_vol,
+        tick.volume,
+        tick.total_volume,
+        tick.tick_type,
+        tick.chg_type,
+        int(tick.simtrade),
+    )
+
+
+def decode_tick(code: str, buffer, offset: int) -> JournalTick:
+    values = TICK_BODY.unpack_from(buffer, offset)
+    fields = (code, ns_to_datetime(values[0]), *values[1:17], bool(values[17]))
+    return JournalTick(*fields)
+
+
+def encode_bidask(bidask) -> bytes:
+    return BIDASK_BODY.pack(
+        datetime_to_ns(bidask.datetime),
+        bidask.bid_total_vol,
+        bidask.ask_total_vol,
+        *levels([float(v) for v in bidask.bid_price], 0.0),
+        *levels(bidask.bid_volume, 0),
+        *levels(bidask.diff_bid_vol, 0),
+        *levels([float(v) for v in bidask.ask_price], 0.0),
+        *levels(bidask.ask_volume, 0),
+        *levels(bidask.diff_ask_vol, 0),
+        float(bidask.first_derived_bid_price),
+        float(bidask.first_derived_ask_price),
+        float(bidask.underlying_price),
+        bidask.first_derived_bid_vol,
+        bidask.first_derived_ask_vol,
+        int(bidask.simtrade),
+    )
+
+
+def decode_bidask(code: str, buffer, offset: int) -> JournalBidAsk:
+    values = BIDASK_BODY.unpack_from(buffer, offset)
+    n = BIDASK_LEVEL
+    derived_bid_price, derived_ask_price, underlying_price, derived_bid_vol, derived_ask_vol = values[3 + 6 * n : -1]
+    return JournalBidAsk(
+        code,
+        ns_to_datetime(values[0]),
+        values[1],
+        values[2],
+        list(values[3 : 3 + n]),
+        list(values[3 + n : 3 + 2 * n]),
+        list(values[3 + 2 * n : 3 + 3 * n]),
+        list(values[3 + 3 * n : 3 + 4 * n]),
+        list(values[3 + 4 * n : 3 + 5 * n]),
+        list(values[3 + 5 * n : 3 + 6 * n]),
+        derived_bid_price,
+        derived_ask_price,
+        underlying_price,
+        derived_bid_vol,
+        derived_ask_vol,
+        bool(values[-1]),
+    )
+
+
+BODY = {KIND_TICK: TICK_BODY, KIND_BIDASK: BIDASK_BODY}
+ENCODER = {KIND_TICK: encode_tick, KIND_BIDASK: encode_bidask}
+DECODER = {KIND_TICK: decode_tick, KIND_BIDASK: decode_bidask}
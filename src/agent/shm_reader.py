@@ -0,0 +1,92 @@
+import struct
+from multiprocessing import shared_memory
+
+from agent.record import (
+    BIDASK_BODY,
+    KIND_BIDASK,
+    KIND_TICK,
+    TICK_BODY,
+    JournalBidAsk,
+    JournalTick,
+    decode_bidask,
+    decode_tick,
+)
+
+# ring layout, a 64 byte header followed by capacity slots
+# header: magic, version, kind, record size, capacity, code, write seq, owner pid
+# slot: seq then the journal record body of the kind, seq is 0 while the slot is being written
+RING_MAGIC = b"TTNR"
+RING_VERSION = 1
+RING_HEADER = struct.Struct("<4sHHII16s")
+WRITE_SEQ = struct.Struct("<Q")
+WRITE_SEQ_OFFSET = RING_HEADER.size
+OWNER_PID = struct.Struct("<Q")
+OWNER_PID_OFFSET = WRITE_SEQ_OFFSET + WRITE_SEQ.size
+HEADER_SIZE = 64
+SLOT_SEQ = struct.Struct("<Q")
+BODIES = {KIND_TICK: TICK_BODY, KIND_BIDASK: BIDASK_BODY}
+KIND_NAMES = {KIND_TICK: "tick", KIND_BIDASK: "bidask"}
+
+
+def slot_size(kind: int) -> int:
+    size = SLOT_SEQ.size + BODIES[kind].size
+    return (size + 7) // 8 * 8
+
+
+# SharedMemory.buf is None once closed
+def shm_buffer(shm: shared_memory.SharedMemory) -> memoryview:
+    buffer = shm.buf
+    if buffer is None:
+        raise ValueError(f"shm {shm.name} is closed")
+    return buffer
+
+
+def ring_name(prefix: str, kind: int, code: str) -> str:
+    return f"{prefix}_{KIND_NAMES[kind]}_{code}"
+
+
+# client side, attach to a ring by name and decode records in place from shared memory
+# only needs this module and agent.record, no titan or grpc dependencies
+# lost counts records overwritten before they were read
+class RingReader:
+    def __init__(self, name: str, from_start: bool = False):
+        self.__shm = shared_memory.SharedMemory(name, create=False, track=False)
+        self.__buf = shm_buffer(self.__shm)
+        magic, version, self.kind, _, self.capacity, code = RING_HEADER.unpack_from(self.__buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.close()
+            raise ValueError(f"{name} is not a titan ring")
+        self.code = code.rstrip(b"\0").decode()
+        self.slot_size = slot_size(self.kind)
+        self.__decode = decode_tick if self.kind == KIND_TICK else decode_bidask
+        self.next_seq = 1 if from_start else self.write_seq + 1
+        self.lost = 0
+
+    @property
+    def write_seq(self) -> int:
+        seq: int = WRITE_SEQ.unpack_from(self.__buf, WRITE_SEQ_OFFSET)[0]
+        return seq
+
+    def read(self, max_items: int = 1024) -> list[JournalTick | JournalBidAsk]:
+        write_seq = self.write_seq
+        if write_seq - self.next_seq + 1 > self.capacity:
+            skipped = write_seq - self.capacity + 1
+            self.lost += skipped - self.next_seq
+            self.next_seq = skipped
+        records: list[JournalTick | JournalBidAsk] = []
+        while self.next_seq <= write_seq and len(records) < max_items:
+            seq = self.next_seq
+            offset = HEADER_SIZE + (seq - 1) % self.capacity * self.slot_size
+            if SLOT_SEQ.unpack_from(self.__buf, offset)[0] != seq:
+                break
+            record = self.__decode(self.code, self.__buf, offset + SLOT_SEQ.size)
+            # overwritten while decoding, resync on the next read
+            if SLOT_SEQ.unpack_from(self.__buf, offset)[0] != seq:
+                break
+            records.append(record)
+            self.next_seq = seq + 1
+        return records
+
+    # the shared memory buffer is released here, reading afterwards raises ValueError
+    def close(self):
+        self.__shm.close()
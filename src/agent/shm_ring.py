@@ -0,0 +1,139 @@
+import os
+import threading
+from multiprocessing import shared_memory
+
+from agent.record import KIND_BIDASK, KIND_TICK, encode_bidask, encode_tick
+from agent.shm_reader import (
+    BODIES,
+    HEADER_SIZE,
+    OWNER_PID,
+    OWNER_PID_OFFSET,
+    RING_HEADER,
+    RING_MAGIC,
+    RING_VERSION,
+    SLOT_SEQ,
+    WRITE_SEQ,
+    WRITE_SEQ_OFFSET,
+    ring_name,
+    shm_buffer,
+    slot_size,
+)
+from logger import logger
+
+
+def process_alive(pid: int) -> bool:
+    # a ring with our own pid is left by an earlier process that had the same pid, e.g. pid 1 in a container
+    if pid <= 0 or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# single writer per ring, slots are published seqlock style so readers never block the writer
+class RingWriter:
+    def __init__(self, name: str, kind: int, code: str, capacity: int):
+        self.name = name
+        self.kind = kind
+        self.capacity = capacity
+        self.slot_size = slot_size(kind)
+        self.seq = 0
+        self.__lock = threading.Lock()
+        self.__closed = False
+        size = HEADER_SIZE + capacity * self.slot_size
+        try:
+            self.__shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            self.__unlink_stale(name)
+            self.__shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.__buf = shm_buffer(self.__shm)
+        RING_HEADER.pack_into(self.__buf, 0, RING_MAGIC, RING_VERSION, kind, BODIES[kind].size, capacity, code.encode())
+        WRITE_SEQ.pack_into(self.__buf, WRITE_SEQ_OFFSET, 0)
+        OWNER_PID.pack_into(self.__buf, OWNER_PID_OFFSET, os.getpid())
+
+    # only a ring whose owner is gone is unlinked, a running titan on the same prefix keeps its ring
+    # readers still attached to the stale ring keep their own mapping
+    @staticmethod
+    def __unlink_stale(name: str):
+        stale = shared_memory.SharedMemory(name, create=False, track=False)
+        try:
+            pid = OWNER_PID.unpack_from(shm_buffer(stale), OWNER_PID_OFFSET)[0] if stale.size >= HEADER_SIZE else 0
+        finally:
+            stale.close()
+        if process_alive(pid):
+            raise FileExistsError(f"shm ring {name} is owned by running process {pid}")
+        logger.warning("unlink stale shm ring %s of process %d", name, pid)
+        stale.unlink()
+
+    def write(self, body: bytes):
+        with self.__lock:
+            if self.__closed:
+                return
+            seq = self.seq + 1
+            offset = HEADER_SIZE + (seq - 1) % self.capacity * self.slot_size
+            SLOT_SEQ.pack_into(self.__buf, offset, 0)
+            self.__buf[offset + SLOT_SEQ.size : offset + SLOT_SEQ.size + len(body)] = body
+            SLOT_SEQ.pack_into(self.__buf, offset, seq)
+            WRITE_SEQ.pack_into(self.__buf, WRITE_SEQ_OFFSET, seq)
+            self.seq = seq
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+            self.__shm.close()
+            self.__shm.unlink()
+
+
+# ref-counted rings per kind and code, written straight from the quote callbacks
+class ShmRings:
+    def __init__(self, prefix: str, capacity: int):
+        self.prefix = prefix
+        self.capacity = capacity
+        self.__lock = threading.Lock()
+        self.__refs: dict[tuple[int, str], int] = {}
+        self.__writers: dict[int, dict[str, RingWriter]] = {KIND_TICK: {}, KIND_BIDASK: {}}
+
+    def open(self, kind: int, code: str) -> RingWriter:
+        with self.__lock:
+            writers = self.__writers[kind]
+            if code not in writers:
+                name = ring_name(self.prefix, kind, code)
+                writers[code] = RingWriter(name, kind, code, self.capacity)
+                logger.info("open shm ring %s", name)
+            self.__refs[(kind, code)] = self.__refs.get((kind, code), 0) + 1
+            return writers[code]
+
+    def close(self, kind: int, code: str):
+        with self.__lock:
+            key = (kind, code)
+            if key not in self.__refs:
+                return
+            self.__refs[key] -= 1
+            if self.__refs[key] > 0:
+                return
+            del self.__refs[key]
+            writer = self.__writers[kind].pop(code)
+        writer.close()
+        logger.info("close shm ring %s", writer.name)
+
+    def close_all(self):
+        with self.__lock:
+            writers = [writer for kind in self.__writers.values() for writer in kind.values()]
+            self.__refs = {}
+            self.__writers = {KIND_TICK: {}, KIND_BIDASK: {}}
+        for writer in writers:
+            writer.close()
+
+    def write_tick(self, tick):
+        writer = self.__writers[KIND_TICK].get(tick.code, None)
+        if writer is not None:
+            writer.write(encode_tick(tick))
+
+    def write_bidask(self, bidask):
+        writer = self.__writers[KIND_BIDASK].get(bidask.code, None)
+        if writer is not None:
+            writer.write(encode_bidask(bidask))
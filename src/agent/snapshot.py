@@ -0,0 +1,110 @@
+import gc
+import os
+from datetime import datetime, timedelta
+from enum import Enum
+
+import msgpack
+from shioaji.contracts import Contract, Future, Option, Stock
+
+from logger import logger
+
+# night session after 15:00 belongs to the next trading date
+NIGHT_SESSION_HOUR = 15
+
+CONTRACT_TYPES: dict[str, type[Contract]] = {
+    "stock": Stock,
+    "future": Future,
+    "option": Option,
+}
+
+# enum members by value, snapshots store enums as their values
+ENUM_VALUES: dict[str, dict] = {
+    name: {member.value: member for member in field.annotation}
+    for name, field in Contract.model_fields.items()
+    if isinstance(field.annotation, type) and issubclass(field.annotation, Enum)
+}
+
+
+def trading_date(now: datetime | None = None) -> str:
+    now = now or datetime.now()
+    if now.hour >= NIGHT_SESSION_HOUR:
+        now += timedelta(days=1)
+    return now.strftime("%Y-%m-%d")
+
+
+FIELDS = tuple(Contract.model_fields)
+# every field is set, so assignments never change it and all contracts can share it
+FIELDS_SET = set(FIELDS)
+
+
+# the state pydantic model_construct leaves, without its per-field default and alias handling
+def construct(contract_type: type[Contract], values: dict) -> Contract:
+    contract = object.__new__(contract_type)
+    object.__setattr__(contract, "__dict__", values)
+    object.__setattr__(contract, "__pydantic_fields_set__", FIELDS_SET)
+    object.__setattr__(contract, "__pydantic_extra__", None)
+    object.__setattr__(contract, "__pydantic_private__", None)
+    return contract
+
+
+# msgpack snapshot of contract maps, one file per trading date
+# contracts are stored as one column per field and rebuilt without validation,
+# they were validated when shioaji fetched them and per-field validation made loading take seconds
+class ContractSnapshot:
+    def __init__(self, directory: str = os.path.join("data", "snapshot")):
+        self.directory = directory
+
+    def path(self, date: str) -> str:
+        return os.path.join(self.directory, f"contracts_{date}.msgpack")
+
+    def save(self, contract_maps: dict[str, dict[str, Contract]]):
+        date = trading_date()
+        os.makedirs(self.directory, exist_ok=True)
+        columns: dict[str, list[list]] = {}
+        for kind, contracts in contract_maps.items():
+            states = [contract.__dict__ for contract in contracts.values()]
+            columns[kind] = [
+                [state[field].value for state in states] if field in ENUM_VALUES else [state[field] for state in states]
+                for field in FIELDS
+            ]
+        payload = msgpack.packb({"fields": FIELDS, "contracts": columns})
+        tmp = f"{self.path(date)}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(payload)
+        os.replace(tmp, self.path(date))
+        for name in os.listdir(self.directory):
+            if name.startswith("contracts_") and os.path.join(self.directory, name) != self.path(date):
+                os.remove(os.path.join(self.directory, name))
+        logger.info("contract snapshot saved: %s, %d bytes", self.path(date), len(payload))
+
+    def load(self) -> dict[str, dict[str, Contract]] | None:
+        path = self.path(trading_date())
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as file:
+                data = msgpack.unpackb(file.read())
+            fields = tuple(data["fields"])
+            if fields != FIELDS:
+                logger.warning("contract snapshot %s has other fields, ignored", path)
+                return None
+            # tens of thousands of small objects, collection passes in between only cost time
+            gc.disable()
+            result = {}
+            for kind, contract_type in CONTRACT_TYPES.items():
+                columns = data["contracts"][kind]
+                for index, field in enumerate(FIELDS):
+                    if field in ENUM_VALUES:
+                        members = ENUM_VALUES[field]
+                        columns[index] = [members[value] for value in columns[index]]
+                contracts = {}
+                for values in zip(*columns):
+                    contract = construct(contract_type, dict(zip(FIELDS, values)))
+                    contracts[contract.code] = contract
+                result[kind] = contracts
+            return result
+        except Exception as e:
+            logger.error("load contract snapshot %s fail: %s", path, e)
+            return None
+        finally:
+            gc.enable()
@@ -0,0 +1,84 @@
+import threading
+
+import shioaji as sj
+import shioaji.constant as sc
+from shioaji.contracts import Contract
+
+from logger import logger
+
+
+# ref-counted quote subscriptions shared by every client
+# subscribe upstream on first acquire, unsubscribe on last release so the quota is recycled
+# each code is placed on the least loaded session, max_count is the quota of one session
+class SubscriptionManager:
+    def __init__(self, api: sj.Shioaji, max_count: int):
+        self.max_count = max_count
+        self.__lock = threading.Lock()
+        self.__sessions: list[sj.Shioaji] = [api]
+        self.__loads: list[int] = [0]
+        self.__refs: dict[tuple[sc.QuoteType, str], int] = {}
+        self.__contracts: dict[tuple[sc.QuoteType, str], Contract] = {}
+        self.__placement: dict[tuple[sc.QuoteType, str], int] = {}
+
+    def add_session(self, api: sj.Shioaji):
+        with self.__lock:
+            self.__sessions.append(api)
+            self.__loads.append(0)
+
+    @property
+    def count(self) -> int:
+        with self.__lock:
+            return len(self.__refs)
+
+    @property
+    def capacity(self) -> int:
+        with self.__lock:
+            return len(self.__sessions) * self.max_count
+
+    def session_loads(self) -> list[int]:
+        with self.__lock:
+            return self.__loads.copy()
+
+    def ref_count(self, quote_type: sc.QuoteType, code: str) -> int:
+        with self.__lock:
+            return self.__refs.get((quote_type, code), 0)
+
+    # return None on success, -1 when quota is full, code on error
+    def acquire(self, contract: Contract, quote_type: sc.QuoteType):
+        key = (quote_type, contract.code)
+        with self.__lock:
+            if key in self.__refs:
+                self.__refs[key] += 1
+                return None
+            session = min(range(len(self.__loads)), key=self.__loads.__getitem__)
+            if self.__loads[session] >= self.max_count:
+                return -1
+            try:
+                self.__sessions[session].quote.subscribe(contract, quote_type=quote_type, version=sc.QuoteVersion.v1)
+            except Exception as e:
+                logger.error("subscribe %s %s fail: %s", quote_type.value, contract.code, e)
+                return contract.code
+            self.__refs[key] = 1
+            self.__contracts[key] = contract
+            self.__placement[key] = session
+            self.__loads[session] += 1
+            logger.info("subscribe %s %s %s on session %d", quote_type.value, contract.code, contract.name, session)
+            return None
+
+    def release(self, code: str, quote_type: sc.QuoteType):
+        key = (quote_type, code)
+        with self.__lock:
+            if key not in self.__refs:
+                return
+            self.__refs[key] -= 1
+            if self.__refs[key] > 0:
+                return
+            del self.__refs[key]
+            contract = self.__contracts.pop(key)
+            session = self.__placement.pop(key)
+            self.__loads[session] -= 1
+            try:
+                self.__sessions[session].quote.unsubscribe(contract, quote_type=quote_type, version=sc.QuoteVersion.v1)
+                logger.info("unsubscribe %s %s %s", quote_type.value, code, contract.name)
+            except Exception as e:
+                logger.error("unsubscribe %s %s fail: %s", quote_type.value, code, e)
@@ -0,0 +1,117 @@
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Iterator
+
+from agent.record import JournalTick, datetime_to_ns, ns_to_datetime
+from agent.snapshot import trading_date
+
+
+# typed columns of one code, 114 bytes per tick
+# every field of the live tick is kept so history ticks match the ticks streamed live, open is fixed for the day
+class TickColumns:
+    def __init__(self, tick):
+        self.open = float(tick.open)
+        self.ts = array("q")
+        self.close = array("d")
+        self.high = array("d")
+        self.low = array("d")
+        self.underlying_price = array("d")
+        self.avg_price = array("d")
+        self.amount = array("d")
+        self.total_amount = array("d")
+        self.price_chg = array("d")
+        self.pct_chg = array("d")
+        self.bid_side_total_vol = array("q")
+        self.ask_side_total_vol = array("q")
+        self.volume = array("q")
+        self.total_volume = array("q")
+        self.tick_type = array("b")
+        self.chg_type = array("b")
+
+    def append(self, ts: int, tick):
+        self.ts.append(ts)
+        self.close.append(float(tick.close))
+        self.high.append(float(tick.high))
+        self.low.append(float(tick.low))
+        self.underlying_price.append(float(tick.underlying_price))
+        self.avg_price.append(float(tick.avg_price))
+        self.amount.append(float(tick.amount))
+        self.total_amount.append(float(tick.total_amount))
+        self.price_chg.append(float(tick.price_chg))
+        self.pct_chg.append(float(tick.pct_chg))
+        self.bid_side_total_vol.append(int(tick.bid_side_total_vol))
+        self.ask_side_total_vol.append(int(tick.ask_side_total_vol))
+        self.volume.append(int(tick.volume))
+        self.total_volume.append(int(tick.total_volume))
+        self.tick_type.append(int(tick.tick_type))
+        self.chg_type.append(int(tick.chg_type))
+
+    def row(self, code: str, i: int) -> JournalTick:
+        return JournalTick(
+            code=code,
+            datetime=ns_to_datetime(self.ts[i]),
+            open=self.open,
+            underlying_price=self.underlying_price[i],
+            avg_price=self.avg_price[i],
+            close=self.close[i],
+            high=self.high[i],
+            low=self.low[i],
+            amount=self.amount[i],
+            total_amount=self.total_amount[i],
+            price_chg=self.price_chg[i],
+            pct_chg=self.pct_chg[i],
+            bid_side_total_vol=self.bid_side_total_vol[i],
+            ask_side_total_vol=self.ask_side_total_vol[i],
+            volume=self.volume[i],
+            total_volume=self.total_volume[i],
+            tick_type=self.tick_type[i],
+            chg_type=self.chg_type[i],
+            simtrade=False,
+        )
+
+
+# today's fop ticks per code as columns, cleared when the trading date changes
+# simulated ticks are not kept
+class TickStore:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__date = ""
+        self.__columns: dict[str, TickColumns] = {}
+
+    def append(self, tick):
+        if tick.simtrade:
+            return
+        ts = datetime_to_ns(tick.datetime)
+        with self.__lock:
+            date = trading_date(tick.datetime)
+            if date != self.__date:
+                self.__columns = {}
+                self.__date = date
+            columns = self.__columns.get(tick.code, None)
+            if columns is None:
+                columns = TickColumns(tick)
+                self.__columns[tick.code] = columns
+            columns.append(ts, tick)
+
+    # (trading date, index of the first tick at or after since_ns, tick count) of one code
+    # ticks are appended in time order
+    def bounds(self, code: str, since_ns: int = 0) -> tuple[str, int, int]:
+        with self.__lock:
+            columns = self.__columns.get(code, None)
+            if columns is None:
+                return self.__date, 0, 0
+            return self.__date, bisect_left(columns.ts, since_ns), len(columns.ts)
+
+    # rows start to end of a bounds result, built lazily outside the lock
+    # columns only grow so indexes below end stay valid, nothing is returned once the date changed
+    def rows(self, date: str, code: str, start: int, end: int) -> Iterator[JournalTick]:
+        with self.__lock:
+            columns = self.__columns.get(code, None) if date == self.__date else None
+        if columns is None:
+            return iter(())
+        return (columns.row(code, i) for i in range(start, min(end, len(columns.ts))))
+
+    def count(self) -> int:
+        with self.__lock:
+            return sum(len(columns.ts) for columns in self.__columns.values())
@@ -1,11 +1,15 @@
 import yaml
 from pydantic import BaseModel
 
-from config.auth import ShioajiAuth
+from config.auth import APISecret, ShioajiAuth
+from config.stream import StreamConfig
 
 
 class Config(BaseModel):
     shioaji_auth: ShioajiAuth
+    # extra api keys only used for quote subscriptions, each adds one session quota
+    quote_sessions: list[APISecret] = []
+    stream: StreamConfig = StreamConfig()
 
     @classmethod
     def from_yaml(cls, file_path: str) -> "Config":
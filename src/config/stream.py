@@ -0,0 +1,29 @@
+from enum import Enum
+
+from pydantic import BaseModel
+
+
+class SlowConsumerPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    CONFLATE = "conflate"
+    DISCONNECT = "disconnect"
+
+
+class StreamConfig(BaseModel):
+    buffer_size: int = 1024
+    # a stale book is useless, bidask keeps only the latest per code
+    tick_policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST
+    bidask_policy: SlowConsumerPolicy = SlowConsumerPolicy.CONFLATE
+    event_policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST
+    batch_size: int = 256
+    batch_latency_ms: float = 1.0
+    kbar_intervals: list[int] = [1, 60, 300]
+    # option chain greeks are recomputed at most once per interval
+    greeks_interval_ms: float = 200.0
+    risk_free_rate: float = 0.0
+    # full book every n messages on the delta bidask stream
+    bidask_snapshot_interval: int = 100
+    # shared memory rings for consumers on the same host, records per ring
+    shm_enabled: bool = False
+    shm_prefix: str = "titan"
+    shm_capacity: int = 16384
@@ -0,0 +1,80 @@
+import grpc
+from panther.basic import basic_pb2
+from panther.order import order_pb2
+from panther.stream import stream_pb2
+
+from agent.readiness import STAGE_CONTRACTS, STAGE_ORDERS, STAGE_SESSION, Readiness
+
+
+def service_name(descriptor, name: str) -> str:
+    full_name: str = descriptor.services_by_name[name].full_name
+    return full_name
+
+
+BASIC = service_name(basic_pb2.DESCRIPTOR, "BasicInterface")
+STREAM = service_name(stream_pb2.DESCRIPTOR, "StreamInterface")
+ORDER = service_name(order_pb2.DESCRIPTOR, "OrderInterface")
+
+# stages each service needs by default, health has none so it is served right after start
+SERVICE_STAGES: dict[str, tuple[str, ...]] = {
+    BASIC: (STAGE_CONTRACTS,),
+    STREAM: (STAGE_SESSION, STAGE_CONTRACTS),
+    ORDER: (STAGE_ORDERS,),
+}
+
+# methods that need less or more than their service default
+METHOD_STAGES: dict[str, tuple[str, ...]] = {
+    f"/{STREAM}/SubscribeShioajiEvent": (),
+    f"/{STREAM}/ReplayFutureTick": (),
+    f"/{STREAM}/ReplayFutureBidAsk": (),
+    f"/{STREAM}/GetFutureTicks": (),
+    f"/{ORDER}/PlaceFutureOrder": (STAGE_CONTRACTS, STAGE_ORDERS),
+    f"/{ORDER}/PlaceStockOrder": (STAGE_CONTRACTS, STAGE_ORDERS),
+}
+
+
+def required_stages(method: str) -> tuple[str, ...]:
+    if method in METHOD_STAGES:
+        return METHOD_STAGES[method]
+    return SERVICE_STAGES.get(method[1:].rsplit("/", 1)[0], ())
+
+
+def abort_handler(handler: grpc.RpcMethodHandler, code: grpc.StatusCode, details: str) -> grpc.RpcMethodHandler:
+    async def abort(_, context):
+        await context.abort(code, details)
+
+    if handler.request_streaming and handler.response_streaming:
+        new_handler = grpc.stream_stream_rpc_method_handler
+    elif handler.request_streaming:
+        new_handler = grpc.stream_unary_rpc_method_handler
+    elif handler.response_streaming:
+        new_handler = grpc.unary_stream_rpc_method_handler
+    else:
+        new_handler = grpc.unary_unary_rpc_method_handler
+    return new_handler(
+        abort,
+        request_deserializer=handler.request_deserializer,
+        response_serializer=handler.response_serializer,
+    )
+
+
+# rpcs are registered before login finishes, calls abort with UNAVAILABLE until their stages are ready
+# clients retry on UNAVAILABLE, the check is a few event flags per call
+# a stage that does not apply to this process fails the call with FAILED_PRECONDITION instead
+class ReadinessInterceptor(grpc.aio.ServerInterceptor):
+    def __init__(self, readiness: Readiness):
+        self.readiness = readiness
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return handler
+        stages = required_stages(handler_call_details.method)
+        if self.readiness.is_ready(*stages):
+            return handler
+        skipped = ", ".join(stage for stage in stages if self.readiness.is_skipped(stage))
+        if skipped:
+            details = f"{skipped} not available on this session"
+            return abort_handler(handler, grpc.StatusCode.FAILED_PRECONDITION, details)
+        pending = ", ".join(stage for stage in stages if not self.readiness.is_ready(stage))
+        return abort_handler(handler, grpc.StatusCode.UNAVAILABLE, f"{pending} not ready")
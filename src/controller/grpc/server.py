@@ -1,33 +1,45 @@
+import asyncio
 import threading
 from concurrent import futures
 
 import grpc
-from panther.basic import basic_pb2_grpc
 from panther.health import health_pb2_grpc
+from panther.order import order_pb2_grpc
 from panther.stream import stream_pb2_grpc
 
 from agent.agent import Agent
-from controller.grpc.v1 import basic, health, stream
+from config.config import Config
+from controller.grpc.readiness import ReadinessInterceptor
+from controller.grpc.v1 import basic, health, order, stream
 from logger import logger
 
 
+# grpc.aio server, streams are coroutines instead of pool threads
+# non-async handlers still run in thread pool
 class GRPCServer:
-    def __init__(self, agent: Agent):
+    def __init__(self, agent: Agent, cfg: Config):
         self.agent = agent
+        self.cfg = cfg
         self.thead_pool = futures.ThreadPoolExecutor()
-        self.srv = grpc.server(self.thead_pool)
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.srv: grpc.aio.Server | None = None
 
         self._stop_lock: threading.Lock = threading.Lock()
         self.stopped = False
 
+    def register(self, srv: grpc.aio.Server):
         health_pb2_grpc.add_HealthInterfaceServicer_to_server(
             health.RPCHealth(
                 stop_function=self.stop,
+                readiness=self.agent.readiness,
             ),
-            self.srv,
+            srv,
         )
-        basic_pb2_grpc.add_BasicInterfaceServicer_to_server(basic.RPCBasic(agent=self.agent), self.srv)
-        stream_pb2_grpc.add_StreamInterfaceServicer_to_server(stream.RPCStream(agent=self.agent), self.srv)
+        srv.add_generic_rpc_handlers((basic.RPCBasic(agent=self.agent).rpc_handler(),))
+        stream_pb2_grpc.add_StreamInterfaceServicer_to_server(
+            stream.RPCStream(agent=self.agent, cfg=self.cfg.stream), srv
+        )
+        order_pb2_grpc.add_OrderInterfaceServicer_to_server(order.RPCOrder(agent=self.agent, cfg=self.cfg.stream), srv)
 
     def stop(self):
         with self._stop_lock:
@@ -36,15 +48,29 @@ class GRPCServer:
             self.stopped = True
         logger.info("Stopping gRPC Server...")
         self.agent.logout()
-        self.srv.stop(grace=None)
+        if self.srv is not None and self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.srv.stop(grace=None), self.loop)
         self.thead_pool.shutdown(wait=False, cancel_futures=True)
         logger.info("gRPC Server is stopped")
 
+    async def serve_async(self, port: str):
+        self.loop = asyncio.get_running_loop()
+        self.loop.set_default_executor(self.thead_pool)
+        self.srv = grpc.aio.server(
+            migration_thread_pool=self.thead_pool,
+            interceptors=(ReadinessInterceptor(self.agent.readiness),),
+        )
+        self.register(self.srv)
+        self.srv.add_insecure_port(f"[::]:{port}")
+        await self.srv.start()
+        logger.info("gRPC Server started at port %s", port)
+        # login runs in background and may have failed before the loop was running
+        if self.stopped:
+            await self.srv.stop(grace=None)
+        await self.srv.wait_for_termination()
+
     def serve_sync(self, port: str):
         try:
-            self.srv.add_insecure_port(f"[::]:{port}")
-            self.srv.start()
-            logger.info("gRPC Server started at port %s", port)
-            self.srv.wait_for_termination()
+            asyncio.run(self.serve_async(port))
         except (Exception, BaseException):
             self.stop()
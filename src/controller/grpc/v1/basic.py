@@ -1,6 +1,21 @@
-from panther.basic import basic_pb2_grpc, future_pb2, option_pb2, stock_pb2
+import asyncio
+
+import grpc
+from google.protobuf import message, message_factory
+from panther.basic import basic_pb2, basic_pb2_grpc, future_pb2, option_pb2, stock_pb2
 
 from agent.agent import Agent
+from metrics import CATALOG_SERVED_BYTES
+
+# client sends the catalog version it holds, server answers with the current one
+# and an empty list when nothing changed since that version
+CATALOG_VERSION_KEY = "catalog-version"
+
+
+def serialize_response(response: bytes | message.Message) -> bytes:
+    if isinstance(response, bytes):
+        return response
+    return response.SerializeToString()
 
 
 class RPCBasic(basic_pb2_grpc.BasicInterfaceServicer):
@@ -10,11 +25,65 @@ class RPCBasic(basic_pb2_grpc.BasicInterfaceServicer):
     ):
         self.agent = agent
 
-    def GetAllStockDetail(self, request, _):
-        return stock_pb2.StockDetailList(list=self.agent.get_all_stocks())
+    async def catalog_response(self, kind: str, context) -> bytes:
+        entry = self.agent.catalog.get(kind)
+        if entry is None:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, f"{kind} catalog not ready")
+            return b""
+        await context.send_initial_metadata(((CATALOG_VERSION_KEY, entry.version),))
+        if dict(context.invocation_metadata() or ()).get(CATALOG_VERSION_KEY) == entry.version:
+            return b""
+        CATALOG_SERVED_BYTES.labels(kind).inc(len(entry.payload))
+        return entry.payload
+
+    async def GetAllStockDetail(self, request, context):
+        return await self.catalog_response("stock", context)
+
+    async def GetAllFutureDetail(self, request, context):
+        return await self.catalog_response("future", context)
+
+    async def GetAllOptionDetail(self, request, context):
+        return await self.catalog_response("option", context)
+
+    # filtered lookups served from the contract index, only matching rows are serialized
+    async def QueryOptionChain(self, request, context):
+        details = await asyncio.get_running_loop().run_in_executor(
+            None,
+            self.agent.query_option_chain,
+            request.underlying,
+            request.delivery_month,
+            request.strike_min,
+            request.strike_max,
+            request.option_right,
+        )
+        return option_pb2.OptionDetailList(list=details)
+
+    async def QueryFutures(self, request, context):
+        details = await asyncio.get_running_loop().run_in_executor(
+            None, self.agent.query_futures, request.underlying_code, request.category, request.symbol
+        )
+        return future_pb2.FutureDetailList(list=details)
+
+    async def QueryStocks(self, request, context):
+        details = await asyncio.get_running_loop().run_in_executor(
+            None, self.agent.query_stocks, request.category, request.exchange
+        )
+        return stock_pb2.StockDetailList(list=details)
 
-    def GetAllFutureDetail(self, request, _):
-        return future_pb2.FutureDetailList(list=self.agent.get_all_futures())
+    async def GetOptionDeliveryMonths(self, request, context):
+        return option_pb2.OptionDeliveryMonthList(months=self.agent.contract_index.option_months(request.underlying))
 
-    def GetAllOptionDetail(self, request, _):
-        return option_pb2.OptionDetailList(list=self.agent.get_all_options())
+    # same as add_BasicInterfaceServicer_to_server but lets handlers return pre-serialized bytes
+    def rpc_handler(self) -> grpc.GenericRpcHandler:
+        service = basic_pb2.DESCRIPTOR.services_by_name["BasicInterface"]
+        return grpc.method_handlers_generic_handler(
+            service.full_name,
+            {
+                method.name: grpc.unary_unary_rpc_method_handler(
+                    getattr(self, method.name),
+                    request_deserializer=message_factory.GetMessageClass(method.input_type).FromString,
+                    response_serializer=serialize_response,
+                )
+                for method in service.methods
+            },
+        )
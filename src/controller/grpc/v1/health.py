@@ -1,18 +1,46 @@
+import asyncio
+
 from google.protobuf import empty_pb2
 from grpc import RpcError
-from panther.health import health_pb2_grpc
+from panther.health import health_pb2, health_pb2_grpc
+
+from agent.readiness import Readiness
 
 
 class RPCHealth(health_pb2_grpc.HealthInterfaceServicer):
     def __init__(
         self,
         stop_function=None,
+        readiness: Readiness | None = None,
     ):
         self.stop_function = stop_function
+        self.readiness = readiness or Readiness()
+
+    # served from the start, ready is true once every applicable stage is done
+    async def GetReadiness(self, request, _):
+        status = self.readiness.status()
+        return health_pb2.Readiness(
+            stages=[health_pb2.StageStatus(stage=stage, ready=ready) for stage, ready in status.items()],
+            ready=all(status.values()),
+            error=self.readiness.error,
+        )
 
-    def HealthChannel(self, request_iterator, _):
+    # stop logs out of shioaji and blocks, it runs in the executor instead of the event loop
+    async def HealthChannel(self, request_iterator, _):
         try:
-            for _ in request_iterator:
+            async for _ in request_iterator:
                 yield empty_pb2.Empty()
         except RpcError:
-            self.stop_function()
+            self.stop()
+        except asyncio.CancelledError:
+            self.stop()
+            raise
+
+    # the executor is already shut down when the server stopped first
+    def stop(self):
+        if self.stop_function is None:
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self.stop_function)
+        except RuntimeError:
+            pass
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from queue import ShutDown
+
+import grpc
+from panther.order import order_pb2, order_pb2_grpc
+from shioaji.order import Trade
+
+from agent.agent import ORDER_EVENT, Agent
+from agent.hub import Mailbox
+from agent.order_book import OrderEvent, OrderRecord
+from agent.order_entry import OrderEntry
+from config.stream import SlowConsumerPolicy, StreamConfig
+from logger import logger
+from metrics import ORDER_SUBMIT_SECONDS, track_stream
+
+
+# order_id is empty until the exchange acknowledges, client_order_id identifies the order meanwhile
+def order_result_pb(trade: Trade) -> order_pb2.OrderResult:
+    return order_pb2.OrderResult(
+        order_id=trade.order.id,
+        client_order_id=trade.order.custom_field or "",
+        code=trade.contract.code,
+        status=str(trade.status.status.value),
+        msg=trade.status.msg or "",
+    )
+
+
+def order_record_pb(record: OrderRecord) -> order_pb2.OrderRecord:
+    return order_pb2.OrderRecord(
+        id=record.id,
+        seqno=record.seqno,
+        ordno=record.ordno,
+        code=record.code,
+        security_type=record.security_type,
+        action=record.action,
+        price=record.price,
+        quantity=record.quantity,
+        status=record.status,
+        deal_quantity=record.deal_quantity,
+        cancel_quantity=record.cancel_quantity,
+        deals=[
+            order_pb2.DealRecord(seq=deal.seq, price=deal.price, quantity=deal.quantity, ts=deal.ts)
+            for deal in record.deals
+        ],
+        client_order_id=record.client_order_id,
+    )
+
+
+def order_event_pb(event: OrderEvent, epoch: str) -> order_pb2.OrderEvent:
+    return order_pb2.OrderEvent(seq=event.seq, epoch=epoch, kind=event.kind, order=order_record_pb(event.record))
+
+
+# orders are sent in shioaji non-blocking mode directly on the event loop, no executor hop
+# the response only acknowledges submission, final state comes with the order events
+class RPCOrder(order_pb2_grpc.OrderInterfaceServicer):
+    def __init__(
+        self,
+        agent: Agent,
+        cfg: StreamConfig,
+    ):
+        self.agent = agent
+        self.cfg = cfg
+
+    async def entry(self, context) -> OrderEntry:
+        entry = self.agent.order_entry
+        if entry is None:
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, "order session not logged in")
+            # abort always raises, this only narrows entry
+            raise RuntimeError("order session not logged in")
+        return entry
+
+    # order_id may also be the client order id returned by place
+    async def trade(self, entry: OrderEntry, order_id: str, context) -> Trade:
+        if entry.is_pending(order_id):
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, f"order {order_id} not acknowledged yet")
+        trade = entry.cached(order_id) or await asyncio.to_thread(entry.trade, order_id)
+        if trade is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"order {order_id} not found")
+        return trade
+
+    # shioaji value errors are bad arguments, anything else is rejected by the session state
+    async def submit(self, context, submit_function, *args):
+        try:
+            return submit_function(*args)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except Exception as e:
+            logger.error("order submit fail: %s", e)
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+
+    async def PlaceFutureOrder(self, request: order_pb2.PlaceFutureOrderRequest, context):
+        start = time.perf_counter()
+        entry = await self.entry(context)
+        contract = self.agent.get_fop_contract_by_code(request.code)
+        if contract is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"contract {request.code} not found")
+        try:
+            template = entry.future_template(request.action, request.price_type, request.order_type, request.octype)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        trade = await self.submit(
+            context, entry.place, contract, template, request.price, request.quantity, request.client_order_id
+        )
+        ORDER_SUBMIT_SECONDS.labels("place").observe(time.perf_counter() - start)
+        return order_result_pb(trade)
+
+    async def PlaceStockOrder(self, request: order_pb2.PlaceStockOrderRequest, context):
+        start = time.perf_counter()
+        entry = await self.entry(context)
+        contract = self.agent.get_stock_contract_by_code(request.code)
+        if contract is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"contract {request.code} not found")
+        try:
+            template = entry.stock_template(
+                request.action, request.price_type, request.order_type, request.order_lot, request.order_cond
+            )
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        trade = await self.submit(
+            context, entry.place, contract, template, request.price, request.quantity, request.client_order_id
+        )
+        ORDER_SUBMIT_SECONDS.labels("place").observe(time.perf_counter() - start)
+        return order_result_pb(trade)
+
+    async def ModifyOrder(self, request: order_pb2.ModifyOrderRequest, context):
+        start = time.perf_counter()
+        entry = await self.entry(context)
+        trade = await self.trade(entry, request.order_id, context)
+        await self.submit(context, entry.update, trade, request.price, request.quantity)
+        ORDER_SUBMIT_SECONDS.labels("modify").observe(time.perf_counter() - start)
+        return order_result_pb(trade)
+
+    async def CancelOrder(self, request: order_pb2.CancelOrderRequest, context):
+        start = time.perf_counter()
+        entry = await self.entry(context)
+        trade = await self.trade(entry, request.order_id, context)
+        await self.submit(context, entry.cancel, trade)
+        ORDER_SUBMIT_SECONDS.labels("cancel").observe(time.perf_counter() - start)
+        return order_result_pb(trade)
+
+    # subscribe before reading the book so nothing falls between the handshake and live events
+    # handshake is deltas after last_seq when still in history, otherwise a snapshot closed by snapshot_end
+    # a last_seq from another epoch (a previous process) always gets a snapshot
+    # a subscriber that falls a full buffer behind is disconnected and resumes with its last seq and epoch
+    @track_stream
+    async def SubscribeOrderEvents(self, request: order_pb2.SubscribeOrderEventsRequest, context):
+        mailbox = Mailbox(self.cfg.buffer_size)
+        self.agent.order_hub.subscribe(ORDER_EVENT, mailbox, SlowConsumerPolicy.DISCONNECT)
+        try:
+            epoch = self.agent.order_book.epoch
+            seq, events, is_snapshot = self.agent.order_book.resume(request.last_seq, request.epoch)
+            for event in events:
+                yield order_event_pb(event, epoch)
+            if is_snapshot:
+                yield order_pb2.OrderEvent(seq=seq, epoch=epoch, kind="snapshot_end")
+            while True:
+                event = await mailbox.aget()
+                if event.seq > seq:
+                    seq = event.seq
+                    yield order_event_pb(event, epoch)
+        except ShutDown:
+            # disconnect keeps the queued items, hub close clears them
+            if len(mailbox) > 0:
+                logger.warning("order event subscriber %d too slow, disconnected at seq %d", mailbox.id, seq)
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "order event subscriber too slow")
+        finally:
+            self.agent.order_hub.unsubscribe(ORDER_EVENT, mailbox)
@@ -1,96 +1,780 @@
+import asyncio
+import time
+from collections.abc import Hashable
 from datetime import datetime
 from queue import ShutDown
 
+import grpc
+import numpy as np
+import shioaji as sj
+import shioaji.constant as sc
 from panther.stream import stream_pb2, stream_pb2_grpc
 
-from agent.agent import Agent
+from agent.agent import SHIOAJI_EVENT, Agent
+from agent.bidask_delta import SCALAR_FIELDS, BidAskDelta, BidAskDeltaEncoder
+from agent.greeks import ChainGreeks
+from agent.hub import Hub, Mailbox
+from agent.journal import KIND_BIDASK, KIND_TICK, JournalReader, valid_journal_date
+from agent.kbar import Kbar
+from agent.quote_store import LatestQuote
+from agent.record import datetime_to_ns
+from agent.shm_reader import HEADER_SIZE, slot_size
+from agent.snapshot import trading_date
+from config.stream import SlowConsumerPolicy, StreamConfig
+from logger import logger
+from metrics import STREAM_LATENCY, track_stream
 
 DATE_TIME_FORMAT: str = "%Y-%m-%d %H:%M:%S.%f"
 
+# FutureTick is about 150 bytes, a page stays well under the default 4 MB receive limit
+MAX_TICK_PAGE = 10000
+# history rows are built and converted off the event loop this many at a time
+TICK_CHUNK = 1000
+
+
+def future_tick_pb(tick: sj.TickFOPv1) -> stream_pb2.FutureTick:
+    return stream_pb2.FutureTick(
+        code=tick.code,
+        date_time=datetime.strftime(tick.datetime, DATE_TIME_FORMAT),
+        open=tick.open,
+        underlying_price=tick.underlying_price,
+        bid_side_total_vol=tick.bid_side_total_vol,
+        ask_side_total_vol=tick.ask_side_total_vol,
+        avg_price=tick.avg_price,
+        close=tick.close,
+        high=tick.high,
+        low=tick.low,
+        amount=tick.amount,
+        total_amount=tick.total_amount,
+        volume=tick.volume,
+        total_volume=tick.total_volume,
+        tick_type=tick.tick_type,
+        chg_type=tick.chg_type,
+        price_chg=tick.price_chg,
+        pct_chg=tick.pct_chg,
+        simtrade=tick.simtrade,
+    )
+
+
+def stock_tick_pb(tick: sj.TickSTKv1) -> stream_pb2.StockTick:
+    return stream_pb2.StockTick(
+        code=tick.code,
+        date_time=datetime.strftime(tick.datetime, DATE_TIME_FORMAT),
+        open=tick.open,
+        avg_price=tick.avg_price,
+        close=tick.close,
+        high=tick.high,
+        low=tick.low,
+        amount=tick.amount,
+        total_amount=tick.total_amount,
+        volume=tick.volume,
+        total_volume=tick.total_volume,
+        tick_type=tick.tick_type,
+        chg_type=tick.chg_type,
+        price_chg=tick.price_chg,
+        pct_chg=tick.pct_chg,
+        bid_side_total_vol=tick.bid_side_total_vol,
+        ask_side_total_vol=tick.ask_side_total_vol,
+        bid_side_total_cnt=tick.bid_side_total_cnt,
+        ask_side_total_cnt=tick.ask_side_total_cnt,
+        closing_oddlot_shares=tick.closing_oddlot_shares,
+        fixed_trade_vol=tick.fixed_trade_vol,
+        suspend=tick.suspend,
+        simtrade=tick.simtrade,
+        intraday_odd=tick.intraday_odd,
+    )
+
+
+def stock_bidask_pb(bidask: sj.BidAskSTKv1) -> stream_pb2.StockBidAsk:
+    return stream_pb2.StockBidAsk(
+        code=bidask.code,
+        date_time=datetime.strftime(bidask.datetime, DATE_TIME_FORMAT),
+        bid_price=bidask.bid_price,
+        bid_volume=bidask.bid_volume,
+        diff_bid_vol=bidask.diff_bid_vol,
+        ask_price=bidask.ask_price,
+        ask_volume=bidask.ask_volume,
+        diff_ask_vol=bidask.diff_ask_vol,
+        suspend=bidask.suspend,
+        simtrade=bidask.simtrade,
+        intraday_odd=bidask.intraday_odd,
+    )
+
+
+def future_bidask_pb(bidask: sj.BidAskFOPv1) -> stream_pb2.FutureBidAsk:
+    return stream_pb2.FutureBidAsk(
+        code=bidask.code,
+        date_time=datetime.strftime(bidask.datetime, DATE_TIME_FORMAT),
+        bid_total_vol=bidask.bid_total_vol,
+        ask_total_vol=bidask.ask_total_vol,
+        simtrade=bidask.simtrade,
+        bid_price=bidask.bid_price,
+        bid_volume=bidask.bid_volume,
+        diff_bid_vol=bidask.diff_bid_vol,
+        ask_price=bidask.ask_price,
+        ask_volume=bidask.ask_volume,
+        diff_ask_vol=bidask.diff_ask_vol,
+        first_derived_bid_price=bidask.first_derived_bid_price,
+        first_derived_ask_price=bidask.first_derived_ask_price,
+        first_derived_bid_vol=bidask.first_derived_bid_vol,
+        first_derived_ask_vol=bidask.first_derived_ask_vol,
+        underlying_price=bidask.underlying_price,
+    )
+
+
+# only the masked fields are read and converted, names match the shioaji quote attributes
+def masked_pb(message_type, quote, fields: tuple[str, ...]):
+    values = {}
+    for name in fields:
+        if name == "date_time":
+            values[name] = datetime.strftime(quote.datetime, DATE_TIME_FORMAT)
+        else:
+            values[name] = getattr(quote, name)
+    return message_type(**values)
+
+
+def tick_prices(tick) -> tuple[float, ...]:
+    return (float(tick.close),)
+
+
+def bidask_prices(bidask) -> tuple[float, ...]:
+    return (
+        float(bidask.bid_price[0]) if bidask.bid_price else 0.0,
+        float(bidask.ask_price[0]) if bidask.ask_price else 0.0,
+    )
+
+
+# per subscriber options applied before conversion
+# max_rate paces sends and the mailbox conflates to the latest quote in between
+# min_price_change drops quotes until a price moved that much from the last one sent
+class QuoteFilter:
+    def __init__(self, max_rate: float, min_price_change: float, prices):
+        self.interval = 1 / max_rate if max_rate > 0 else 0.0
+        self.min_price_change = min_price_change
+        self.prices = prices
+        self.__last_prices: tuple[float, ...] | None = None
+
+    def accept(self, quote) -> bool:
+        if self.min_price_change <= 0:
+            return True
+        prices = self.prices(quote)
+        if self.__last_prices is not None and all(
+            abs(price - last) < self.min_price_change for price, last in zip(prices, self.__last_prices)
+        ):
+            return False
+        self.__last_prices = prices
+        return True
+
+    # called after each send, the mailbox conflates while sleeping
+    async def pace(self):
+        if self.interval > 0:
+            await asyncio.sleep(self.interval)
+
+
+def future_kbar_pb(bar: Kbar) -> stream_pb2.FutureKbar:
+    return stream_pb2.FutureKbar(
+        code=bar.code,
+        interval=bar.interval,
+        date_time=datetime.strftime(bar.start_time, DATE_TIME_FORMAT),
+        open=bar.open,
+        high=bar.high,
+        low=bar.low,
+        close=bar.close,
+        volume=bar.volume,
+        amount=bar.amount,
+        vwap=bar.vwap,
+        closed=bar.closed,
+    )
+
+
+def latest_quote_pb(quote: LatestQuote) -> stream_pb2.LatestQuote:
+    return stream_pb2.LatestQuote(
+        code=quote.code,
+        tick_time=datetime.strftime(quote.tick_time, DATE_TIME_FORMAT) if quote.tick_time else "",
+        bidask_time=datetime.strftime(quote.bidask_time, DATE_TIME_FORMAT) if quote.bidask_time else "",
+        close=quote.close,
+        open=quote.open,
+        high=quote.high,
+        low=quote.low,
+        volume=int(quote.volume),
+        total_volume=int(quote.total_volume),
+        underlying_price=quote.underlying_price,
+        price_chg=quote.price_chg,
+        pct_chg=quote.pct_chg,
+        bid_price=quote.bid_price,
+        bid_volume=int(quote.bid_volume),
+        ask_price=quote.ask_price,
+        ask_volume=int(quote.ask_volume),
+    )
+
+
+# unchanged scalars are left unset and changed_mask tells which ones were sent
+# timestamp is ns since epoch instead of a formatted string
+def future_bidask_delta_pb(delta: BidAskDelta) -> stream_pb2.FutureBidAskDelta:
+    message = stream_pb2.FutureBidAskDelta(
+        seq=delta.seq,
+        code=delta.code,
+        ts=delta.ts,
+        full=delta.full,
+        levels=[
+            stream_pb2.BidAskLevel(side=change.side, level=change.level, price=change.price, volume=change.volume)
+            for change in delta.levels
+        ],
+        changed_mask=delta.changed,
+    )
+    for name in SCALAR_FIELDS:
+        value = getattr(delta, name)
+        if value is not None:
+            setattr(message, name, value)
+    return message
+
+
+# nan greeks (no quote or price outside arbitrage bounds) are sent as zero
+def option_chain_greeks_pb(greeks: ChainGreeks) -> stream_pb2.OptionChainGreeks:
+    columns = [
+        np.nan_to_num(column).tolist() for column in (greeks.price, greeks.iv, greeks.delta, greeks.gamma, greeks.vega)
+    ]
+    return stream_pb2.OptionChainGreeks(
+        underlying=greeks.product,
+        delivery_month=greeks.delivery_month,
+        underlying_price=greeks.underlying_price,
+        date_time=datetime.strftime(greeks.computed_at, DATE_TIME_FORMAT),
+        list=[
+            stream_pb2.OptionGreeks(
+                code=code,
+                strike_price=strike,
+                option_right="C" if is_call else "P",
+                price=price,
+                iv=iv,
+                delta=delta,
+                gamma=gamma,
+                vega=vega,
+            )
+            for code, strike, is_call, price, iv, delta, gamma, vega in zip(
+                greeks.codes, greeks.strikes.tolist(), greeks.is_call.tolist(), *columns
+            )
+        ],
+    )
+
+
+# control tasks are cancelled by a closing generator that cannot await them, their outcome is retrieved here
+def cancel_task(task: asyncio.Task):
+    task.cancel()
+    task.add_done_callback(control_done)
+
+
+def control_done(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("stream control fail: %s", task.exception())
+
 
 class RPCStream(stream_pb2_grpc.StreamInterfaceServicer):
     def __init__(
         self,
         agent: Agent,
+        cfg: StreamConfig,
     ):
         self.agent = agent
+        self.cfg = cfg
+        self.policies = {
+            agent.tick_hub.name: cfg.tick_policy,
+            agent.stock_tick_hub.name: cfg.tick_policy,
+            agent.bidask_hub.name: cfg.bidask_policy,
+            agent.stock_bidask_hub.name: cfg.bidask_policy,
+            agent.event_hub.name: cfg.event_policy,
+            agent.kbar.hub.name: SlowConsumerPolicy.DROP_OLDEST,
+            agent.greeks.hub.name: SlowConsumerPolicy.CONFLATE,
+        }
+
+    def new_mailbox(self) -> Mailbox:
+        return Mailbox(self.cfg.buffer_size)
 
-    def SubscribeShioajiEvent(self, request, context):
-        queue = self.agent.get_event_queue()
-        if queue is None:
+    def attach(self, hub: Hub, key: Hashable, mailbox: Mailbox, policy: SlowConsumerPolicy | None = None):
+        hub.subscribe(key, mailbox, policy or self.policies[hub.name])
+
+    def detach(self, hub: Hub, key: Hashable, mailbox: Mailbox):
+        hub.unsubscribe(key, mailbox)
+        if mailbox.dropped > 0:
+            logger.warning(
+                "%s %s subscriber dropped %d, conflated %d", hub.name, key, mailbox.dropped, mailbox.conflated
+            )
+
+    # disconnect keeps the queued items, hub close clears them
+    async def evicted(self, name: str, mailbox: Mailbox, context):
+        if len(mailbox) > 0:
+            logger.warning("%s subscriber %d too slow, disconnected", name, mailbox.id)
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"{name} subscriber too slow")
+
+    def batch_limit(self, request: stream_pb2.SubscribeFutureBatchRequest) -> tuple[int, float]:
+        max_size = request.max_batch_size if request.max_batch_size > 0 else self.cfg.batch_size
+        max_latency_ms = request.max_latency_ms if request.max_latency_ms > 0 else self.cfg.batch_latency_ms
+        return max_size, max_latency_ms / 1000
+
+    # release must not await, the generator may already be closing
+    def release(self, code: str, quote_type: sc.QuoteType):
+        asyncio.get_running_loop().run_in_executor(None, self.agent.unsubscribe, code, quote_type)
+
+    # subscribe keeps running in its worker thread when the stream is cancelled meanwhile,
+    # a cancelled acquire is released once it completes so its quota slot is not leaked
+    async def acquire(self, code: str, quote_type: sc.QuoteType, is_stock: bool = False) -> bool:
+        task = asyncio.ensure_future(asyncio.to_thread(self.agent.subscribe, code, quote_type, is_stock))
+        try:
+            return await asyncio.shield(task) is None
+        except asyncio.CancelledError:
+            task.add_done_callback(lambda done: self.release_acquired(done, code, quote_type))
+            raise
+
+    def release_acquired(self, task: asyncio.Future, code: str, quote_type: sc.QuoteType):
+        if not task.cancelled() and task.exception() is None and task.result() is None:
+            self.release(code, quote_type)
+
+    async def quote_stream(
+        self,
+        code: str,
+        quote_type: sc.QuoteType,
+        hub: Hub,
+        context,
+        is_stock: bool = False,
+        quote_filter: QuoteFilter | None = None,
+    ):
+        if code == "":
+            return
+        if not await self.acquire(code, quote_type, is_stock):
             return
+        mailbox = self.new_mailbox()
+        throttled = quote_filter is not None and quote_filter.interval > 0
+        self.attach(hub, code, mailbox, SlowConsumerPolicy.CONFLATE if throttled else None)
+        latency = STREAM_LATENCY.labels(hub.name)
         try:
             while True:
-                event = queue.get(block=True)
-                yield event
+                item = await mailbox.aget()
+                latency.observe((time.monotonic_ns() - mailbox.last_put_ns) / 1e9)
+                if quote_filter is None:
+                    yield item
+                    continue
+                if not quote_filter.accept(item):
+                    continue
+                yield item
+                await quote_filter.pace()
         except ShutDown:
-            pass
+            await self.evicted(hub.name, mailbox, context)
+        finally:
+            self.detach(hub, code, mailbox)
+            self.release(code, quote_type)
+
+    # returns the converter and filter for the request options, aborts on unknown mask fields
+    async def subscriber_options(
+        self, request: stream_pb2.SubscribeFutureRequest, message_type, convert, prices, context
+    ):
+        quote_filter = None
+        if request.max_rate > 0 or request.min_price_change > 0:
+            quote_filter = QuoteFilter(request.max_rate, request.min_price_change, prices)
+        paths = tuple(request.field_mask.paths)
+        if not paths:
+            return convert, quote_filter
+        unknown = [path for path in paths if path not in message_type.DESCRIPTOR.fields_by_name]
+        if unknown:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "unknown fields: " + ", ".join(unknown))
+        fields = tuple(dict.fromkeys(("code", *paths)))
+        return (lambda quote: masked_pb(message_type, quote, fields)), quote_filter
+
+    async def quote_batch_stream(
+        self, code: str, quote_type: sc.QuoteType, hub: Hub, max_size: int, max_latency: float, context
+    ):
+        if code == "":
+            return
+        if not await self.acquire(code, quote_type):
+            return
+        mailbox = self.new_mailbox()
+        self.attach(hub, code, mailbox)
+        latency = STREAM_LATENCY.labels(hub.name)
+        try:
+            while True:
+                batch = await mailbox.aget_batch(max_size, max_latency)
+                latency.observe((time.monotonic_ns() - mailbox.batch_put_ns) / 1e9)
+                yield batch
+        except ShutDown:
+            await self.evicted(hub.name, mailbox, context)
+        finally:
+            self.detach(hub, code, mailbox)
+            self.release(code, quote_type)
+
+    # speed 0 replays as fast as the client reads, otherwise at that multiple of recorded time
+    async def journal_replay(self, request: stream_pb2.ReplayFutureRequest, kind: int, context):
+        if request.code == "":
+            return
+        date = request.date or trading_date()
+        if not valid_journal_date(date):
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "date must be YYYY-MM-DD")
+        try:
+            reader = await asyncio.to_thread(JournalReader, self.agent.journal.directory, date)
+        except FileNotFoundError:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"journal {date} not found")
+        previous = None
+        for record in reader.records(kind, request.code):
+            if request.speed > 0 and previous is not None:
+                delay = (record.datetime - previous).total_seconds() / request.speed
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            previous = record.datetime
+            yield record
+
+    @track_stream
+    async def SubscribeShioajiEvent(self, _, context):
+        mailbox = self.new_mailbox()
+        self.attach(self.agent.event_hub, SHIOAJI_EVENT, mailbox)
+        try:
+            while True:
+                yield await mailbox.aget()
+        except ShutDown:
+            await self.evicted(self.agent.event_hub.name, mailbox, context)
+        finally:
+            self.detach(self.agent.event_hub, SHIOAJI_EVENT, mailbox)
+
+    # future and option codes are both accepted
+    @track_stream
+    async def SubscribeFutureTick(self, request: stream_pb2.SubscribeFutureRequest, context):
+        convert, quote_filter = await self.subscriber_options(
+            request, stream_pb2.FutureTick, future_tick_pb, tick_prices, context
+        )
+        async for tick in self.quote_stream(
+            request.code, sc.QuoteType.Tick, self.agent.tick_hub, context, quote_filter=quote_filter
+        ):
+            yield convert(tick)
+
+    @track_stream
+    async def SubscribeFutureBidAsk(self, request: stream_pb2.SubscribeFutureRequest, context):
+        convert, quote_filter = await self.subscriber_options(
+            request, stream_pb2.FutureBidAsk, future_bidask_pb, bidask_prices, context
+        )
+        async for bidask in self.quote_stream(
+            request.code, sc.QuoteType.BidAsk, self.agent.bidask_hub, context, quote_filter=quote_filter
+        ):
+            yield convert(bidask)
+
+    @track_stream
+    async def SubscribeStockTick(self, request: stream_pb2.SubscribeStockRequest, context):
+        async for tick in self.quote_stream(request.code, sc.QuoteType.Tick, self.agent.stock_tick_hub, context, True):
+            yield stock_tick_pb(tick)
+
+    @track_stream
+    async def SubscribeStockBidAsk(self, request: stream_pb2.SubscribeStockRequest, context):
+        async for bidask in self.quote_stream(
+            request.code, sc.QuoteType.BidAsk, self.agent.stock_bidask_hub, context, True
+        ):
+            yield stock_bidask_pb(bidask)
+
+    @track_stream
+    async def SubscribeFutureTickBatch(self, request: stream_pb2.SubscribeFutureBatchRequest, context):
+        max_size, max_latency = self.batch_limit(request)
+        async for batch in self.quote_batch_stream(
+            request.code, sc.QuoteType.Tick, self.agent.tick_hub, max_size, max_latency, context
+        ):
+            yield stream_pb2.FutureTickBatch(list=[future_tick_pb(tick) for tick in batch])
+
+    @track_stream
+    async def SubscribeFutureBidAskBatch(self, request: stream_pb2.SubscribeFutureBatchRequest, context):
+        max_size, max_latency = self.batch_limit(request)
+        async for batch in self.quote_batch_stream(
+            request.code, sc.QuoteType.BidAsk, self.agent.bidask_hub, max_size, max_latency, context
+        ):
+            yield stream_pb2.FutureBidAskBatch(list=[future_bidask_pb(bidask) for bidask in batch])
+
+    # one bidirectional stream for many codes, client adds or removes tick/bidask per code
+    # and every update is multiplexed in arrival order onto the same mailbox
+    @track_stream
+    async def SubscribeFutureMulti(self, request_iterator, context):
+        mailbox = self.new_mailbox()
+        topics: set[tuple[Hub, sc.QuoteType, str]] = set()
+        feeds = (
+            (self.agent.tick_hub, sc.QuoteType.Tick),
+            (self.agent.bidask_hub, sc.QuoteType.BidAsk),
+        )
+
+        async def control():
+            async for request in request_iterator:
+                if request.code == "":
+                    continue
+                for enabled, (hub, quote_type) in zip((request.tick, request.bidask), feeds):
+                    topic = (hub, quote_type, request.code)
+                    if not enabled:
+                        continue
+                    if request.remove:
+                        if topic in topics:
+                            topics.discard(topic)
+                            self.detach(hub, request.code, mailbox)
+                            self.release(request.code, quote_type)
+                    elif topic not in topics:
+                        if await self.acquire(request.code, quote_type):
+                            topics.add(topic)
+                            self.attach(hub, request.code, mailbox)
+
+        control_task = asyncio.create_task(control())
+        try:
+            while True:
+                topic, item = await mailbox.aget_with_topic()
+                # hubs put (hub name, key) topics
+                name = topic[0] if isinstance(topic, tuple) else ""
+                STREAM_LATENCY.labels(name).observe((time.monotonic_ns() - mailbox.last_put_ns) / 1e9)
+                if name == self.agent.tick_hub.name:
+                    yield stream_pb2.FutureQuote(tick=future_tick_pb(item))
+                else:
+                    yield stream_pb2.FutureQuote(bidask=future_bidask_pb(item))
+        except ShutDown:
+            await self.evicted("future multi", mailbox, context)
+        finally:
+            cancel_task(control_task)
+            for hub, quote_type, code in topics:
+                self.detach(hub, code, mailbox)
+                self.release(code, quote_type)
+
+    # first request picks the code, later requests with resync ask for a full book on the next message
+    # seq increases by one per message so a client can detect gaps in its own handling
+    @track_stream
+    async def SubscribeFutureBidAskDelta(self, request_iterator, context):
+        first = await anext(request_iterator, None)
+        if first is None or first.code == "":
+            return
+        code = first.code
+        if not await self.acquire(code, sc.QuoteType.BidAsk):
+            return
+        encoder = BidAskDeltaEncoder(first.snapshot_interval or self.cfg.bidask_snapshot_interval)
+        mailbox = self.new_mailbox()
+        self.attach(self.agent.bidask_hub, code, mailbox)
+
+        async def control():
+            async for request in request_iterator:
+                if request.resync:
+                    encoder.resync()
+
+        control_task = asyncio.create_task(control())
+        latency = STREAM_LATENCY.labels(self.agent.bidask_hub.name)
+        try:
+            while True:
+                bidask = await mailbox.aget()
+                latency.observe((time.monotonic_ns() - mailbox.last_put_ns) / 1e9)
+                yield future_bidask_delta_pb(encoder.encode(bidask))
+        except ShutDown:
+            await self.evicted(self.agent.bidask_hub.name, mailbox, context)
+        finally:
+            cancel_task(control_task)
+            self.detach(self.agent.bidask_hub, code, mailbox)
+            self.release(code, sc.QuoteType.BidAsk)
+
+    @track_stream
+    async def ReplayFutureTick(self, request: stream_pb2.ReplayFutureRequest, context):
+        async for tick in self.journal_replay(request, KIND_TICK, context):
+            yield future_tick_pb(tick)
 
-    def SubscribeFutureTick(self, request: stream_pb2.SubscribeFutureRequest, _):
+    @track_stream
+    async def ReplayFutureBidAsk(self, request: stream_pb2.ReplayFutureRequest, context):
+        async for bidask in self.journal_replay(request, KIND_BIDASK, context):
+            yield future_bidask_pb(bidask)
+
+    # bar updates and closed bars, the bar in progress is sent first after attaching
+    # updates of that bar queued before it was read are older and skipped, closed bars are not
+    @track_stream
+    async def SubscribeFutureKbar(self, request: stream_pb2.SubscribeFutureKbarRequest, context):
         if request.code == "":
             return
-        result = self.agent.subscribe_future_tick(request.code)
-        if result is not None:
+        if request.interval not in self.agent.kbar.intervals:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"interval {request.interval} not supported")
+        if not await self.acquire(request.code, sc.QuoteType.Tick):
             return
-        queue = self.agent.get_tick_queue(request.code)
-        if queue is None:
+        key = (request.code, request.interval)
+        mailbox = self.new_mailbox()
+        self.attach(self.agent.kbar.hub, key, mailbox)
+        try:
+            current = self.agent.kbar.current(request.code, request.interval)
+            if current is not None:
+                yield future_kbar_pb(current)
+            while True:
+                bar = await mailbox.aget()
+                if (
+                    current is not None
+                    and not bar.closed
+                    and bar.start == current.start
+                    and bar.volume <= current.volume
+                ):
+                    continue
+                current = None
+                yield future_kbar_pb(bar)
+        except ShutDown:
+            pass
+        finally:
+            self.detach(self.agent.kbar.hub, key, mailbox)
+            self.release(request.code, sc.QuoteType.Tick)
+
+    async def GetFutureKbars(self, request: stream_pb2.SubscribeFutureKbarRequest, context):
+        if request.interval not in self.agent.kbar.intervals:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"interval {request.interval} not supported")
+        bars = self.agent.kbar.snapshot(request.code, request.interval)
+        return stream_pb2.FutureKbarList(list=[future_kbar_pb(bar) for bar in bars])
+
+    # codes never quoted since subscription are left out of the response
+    async def GetLatestQuotes(self, request: stream_pb2.GetLatestQuotesRequest, _):
+        quotes = self.agent.quote_store.get(list(request.codes))
+        return stream_pb2.LatestQuoteList(list=[latest_quote_pb(quote) for quote in quotes])
+
+    # subscribes bidask of every option in the strike window, the chain is recomputed on the greeks interval
+    @track_stream
+    async def SubscribeOptionGreeks(self, request: stream_pb2.SubscribeOptionGreeksRequest, context):
+        if request.underlying == "" or request.delivery_month == "":
             return
+        # every row holds a bidask subscription, an open window on a full month would take the whole quota
+        if request.strike_max <= 0 or request.strike_min > request.strike_max:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "strike_min and strike_max must bound the chain")
+        contracts = await asyncio.to_thread(
+            self.agent.option_chain_contracts,
+            request.underlying,
+            request.delivery_month,
+            request.strike_min,
+            request.strike_max,
+        )
+        if not contracts:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"{request.underlying} {request.delivery_month} not found")
+        # every tracker holds bidask of all rows of the chain, so rows stay quoted until the last one leaves
+        subscription = self.agent.subscription
+        new = sum(1 for contract in contracts if subscription.ref_count(sc.QuoteType.BidAsk, contract.code) == 0)
+        if new > subscription.capacity - subscription.count:
+            await context.abort(
+                grpc.StatusCode.RESOURCE_EXHAUSTED,
+                f"chain needs {new} subscriptions, {subscription.capacity - subscription.count} left",
+            )
+        key = (request.underlying, request.delivery_month, request.strike_min, request.strike_max)
+        codes = self.agent.greeks.track(key, contracts)
+        subscribed: list[str] = []
+        try:
+            for code in codes:
+                if not await self.acquire(code, sc.QuoteType.BidAsk):
+                    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "subscription quota is full")
+                subscribed.append(code)
+        except BaseException:
+            self.agent.greeks.untrack(key)
+            for code in subscribed:
+                self.release(code, sc.QuoteType.BidAsk)
+            raise
+        mailbox = self.new_mailbox()
+        self.attach(self.agent.greeks.hub, key, mailbox)
         try:
             while True:
-                tick = queue.get(block=True)
-                yield stream_pb2.FutureTick(
-                    code=tick.code,
-                    date_time=datetime.strftime(tick.datetime, DATE_TIME_FORMAT),
-                    open=tick.open,
-                    underlying_price=tick.underlying_price,
-                    bid_side_total_vol=tick.bid_side_total_vol,
-                    ask_side_total_vol=tick.ask_side_total_vol,
-                    avg_price=tick.avg_price,
-                    close=tick.close,
-                    high=tick.high,
-                    low=tick.low,
-                    amount=tick.amount,
-                    total_amount=tick.total_amount,
-                    volume=tick.volume,
-                    total_volume=tick.total_volume,
-                    tick_type=tick.tick_type,
-                    chg_type=tick.chg_type,
-                    price_chg=tick.price_chg,
-                    pct_chg=tick.pct_chg,
-                    simtrade=tick.simtrade,
-                )
+                yield option_chain_greeks_pb(await mailbox.aget())
         except ShutDown:
             pass
+        finally:
+            self.detach(self.agent.greeks.hub, key, mailbox)
+            self.agent.greeks.untrack(key)
+            for code in subscribed:
+                self.release(code, sc.QuoteType.BidAsk)
 
-    def SubscribeFutureBidAsk(self, request: stream_pb2.SubscribeFutureRequest, _):
+    # local transport, the stream only carries the ring location and holds the subscription while open
+    # records are read with agent.shm_reader.RingReader, closing the stream releases the ring
+    @track_stream
+    async def SubscribeSharedRing(self, request: stream_pb2.SubscribeSharedRingRequest, context):
+        if not self.cfg.shm_enabled:
+            await context.abort(grpc.StatusCode.UNIMPLEMENTED, "shared memory transport disabled")
         if request.code == "":
             return
-        result = self.agent.subscribe_future_bidask(request.code)
-        if result is not None:
+        kind, quote_type = (KIND_BIDASK, sc.QuoteType.BidAsk) if request.bidask else (KIND_TICK, sc.QuoteType.Tick)
+        if not await self.acquire(request.code, quote_type):
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"subscribe {request.code} fail")
+        try:
+            ring = await asyncio.to_thread(self.agent.shm_rings.open, kind, request.code)
+        except FileExistsError as e:
+            self.release(request.code, quote_type)
+            await context.abort(grpc.StatusCode.ALREADY_EXISTS, str(e))
+            raise
+        except Exception:
+            self.release(request.code, quote_type)
+            raise
+        try:
+            yield stream_pb2.SharedRing(
+                name=ring.name,
+                code=request.code,
+                bidask=request.bidask,
+                capacity=ring.capacity,
+                header_size=HEADER_SIZE,
+                slot_size=slot_size(kind),
+            )
+            await asyncio.Event().wait()
+        finally:
+            self.agent.shm_rings.close(kind, request.code)
+            self.release(request.code, quote_type)
+
+    # empty since means from the start of the trading date
+    async def since_ns(self, since: str, context) -> int:
+        if since == "":
+            return 0
+        try:
+            since_time = datetime.strptime(since, DATE_TIME_FORMAT)
+        except ValueError:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"since must be {DATE_TIME_FORMAT}")
+            raise
+        return datetime_to_ns(since_time)
+
+    def tick_pbs(self, date: str, code: str, start: int, end: int) -> list[stream_pb2.FutureTick]:
+        return [future_tick_pb(tick) for tick in self.agent.tick_store.rows(date, code, start, end)]
+
+    # page token is "<trading date>:<index>", a token of another trading date is rejected
+    async def GetFutureTicks(self, request: stream_pb2.GetFutureTicksRequest, context):
+        limit = min(request.limit, MAX_TICK_PAGE) if request.limit > 0 else MAX_TICK_PAGE
+        date, start, end = self.agent.tick_store.bounds(request.code, await self.since_ns(request.since, context))
+        if request.page_token != "":
+            token_date, _, index = request.page_token.partition(":")
+            if token_date != date or not index.isdigit():
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "page token is invalid or expired")
+            start = int(index)
+        stop = min(start + limit, end)
+        ticks = await asyncio.to_thread(self.tick_pbs, date, request.code, start, stop)
+        return stream_pb2.FutureTickList(list=ticks, next_page_token=f"{date}:{stop}" if stop < end else "")
+
+    # history then live on one stream, the mailbox is attached before the store is read
+    # ticks are stored before they are published, so every tick past the store end just read also reaches
+    # the mailbox, unless the mailbox dropped it while history was sent
+    # history is re-read from where it stopped until one pass completes without drops
+    # ticks already sent are skipped by total volume, which only grows within a day
+    # a drop once live aborts with RESOURCE_EXHAUSTED, the client resumes with since
+    @track_stream
+    async def SubscribeFutureTickFrom(self, request: stream_pb2.GetFutureTicksRequest, context):
+        if request.code == "":
             return
-        queue = self.agent.get_bidask_queue(request.code)
-        if queue is None:
+        since_ns = await self.since_ns(request.since, context)
+        if not await self.acquire(request.code, sc.QuoteType.Tick):
             return
+        mailbox = self.new_mailbox()
+        # drops must be counted, the configured tick policy may conflate or disconnect instead
+        self.attach(self.agent.tick_hub, request.code, mailbox, SlowConsumerPolicy.DROP_OLDEST)
         try:
+            last_total_volume = -1
+            date, start, _ = self.agent.tick_store.bounds(request.code, since_ns)
+            while True:
+                dropped = mailbox.dropped
+                end_date, _, end = self.agent.tick_store.bounds(request.code)
+                if end_date != date:
+                    date, start, last_total_volume = end_date, 0, -1
+                for chunk_start in range(start, end, TICK_CHUNK):
+                    chunk = await asyncio.to_thread(
+                        self.tick_pbs, date, request.code, chunk_start, min(chunk_start + TICK_CHUNK, end)
+                    )
+                    for tick_pb in chunk:
+                        yield tick_pb
+                    if chunk:
+                        last_total_volume = chunk[-1].total_volume
+                start = end
+                if mailbox.dropped == dropped:
+                    break
             while True:
-                bidask = queue.get(block=True)
-                yield stream_pb2.FutureBidAsk(
-                    code=bidask.code,
-                    date_time=datetime.strftime(bidask.datetime, DATE_TIME_FORMAT),
-                    bid_total_vol=bidask.bid_total_vol,
-                    ask_total_vol=bidask.ask_total_vol,
-                    simtrade=bidask.simtrade,
-                    bid_price=bidask.bid_price,
-                    bid_volume=bidask.bid_volume,
-                    diff_bid_vol=bidask.diff_bid_vol,
-                    ask_price=bidask.ask_price,
-                    ask_volume=bidask.ask_volume,
-                    diff_ask_vol=bidask.diff_ask_vol,
-                    first_derived_bid_price=bidask.first_derived_bid_price,
-                    first_derived_ask_price=bidask.first_derived_ask_price,
-                    first_derived_bid_vol=bidask.first_derived_bid_vol,
-                    first_derived_ask_vol=bidask.first_derived_ask_vol,
-                    underlying_price=bidask.underlying_price,
-                )
+                tick = await mailbox.aget()
+                if mailbox.dropped > dropped:
+                    logger.warning("tick subscriber %d too slow, dropped %d", mailbox.id, mailbox.dropped - dropped)
+                    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "tick subscriber too slow")
+                if not tick.simtrade and tick.total_volume <= last_total_volume:
+                    continue
+                # dedupe only covers the overlap, total volume restarts on the next trading date
+                last_total_volume = -1
+                yield future_tick_pb(tick)
         except ShutDown:
             pass
+        finally:
+            self.detach(self.agent.tick_hub, request.code, mailbox)
+            self.release(request.code, sc.QuoteType.Tick)
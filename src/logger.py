@@ -1,7 +1,13 @@
 import logging
 import os
-from datetime import datetime
+import sys
+import threading
+import time
 from logging import LogRecord
+from queue import Empty, SimpleQueue
+from typing import TextIO
+
+LOG_BATCH_SIZE = 512
 
 
 class RFC3339Formatter(logging.Formatter):
@@ -11,6 +17,8 @@ class RFC3339Formatter(logging.Formatter):
         if is_file:
             self.log_format = "%(levelname)s[%(asctime)s] %(message)s"
         super().__init__(self.log_format)
+        self.__cached_second = -1
+        self.__cached_prefix = ""
 
     def format(self, record: LogRecord) -> str:
         if self.is_file:
@@ -29,16 +37,103 @@ class RFC3339Formatter(logging.Formatter):
             color_code = "\x1b[31m"
         return f"{color_code}{super().format(record)}"
 
+    # date and time part only changes once per second, only the writer thread formats
     def formatTime(self, record, datefmt=None):
-        return datetime.fromtimestamp(record.created).astimezone().strftime("%Y-%m-%d %H:%M:%S.%f")
+        second = int(record.created)
+        if second != self.__cached_second:
+            self.__cached_second = second
+            self.__cached_prefix = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return f"{self.__cached_prefix}.{int((record.created - second) * 1_000_000):06d}"
+
+
+# one file per local date, reopened when the first record of a new date is written
+class DailyFile:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.__date = ""
+        self.__file: TextIO | None = None
+
+    def write(self, created: float, text: str):
+        date = time.strftime("%Y-%m-%d", time.localtime(created))
+        file = self.__file
+        if file is None or date != self.__date:
+            self.close()
+            file = open(os.path.join(self.directory, f"{date}.log"), "a", encoding="utf-8")
+            self.__file = file
+            self.__date = date
+        file.write(text)
+
+    def flush(self):
+        if self.__file is not None:
+            self.__file.flush()
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+# callers only merge the message and enqueue, a writer thread formats and writes records in batches
+# so slow disk or console never blocks quote and order callbacks
+class AsyncLogHandler(logging.Handler):
+    def __init__(self, directory: str):
+        super().__init__()
+        self.__queue: SimpleQueue[LogRecord | None] = SimpleQueue()
+        self.__console = RFC3339Formatter(is_file=False)
+        self.__file_formatter = RFC3339Formatter(is_file=True)
+        self.__file = DailyFile(directory)
+        self.__thread = threading.Thread(target=self.writer, daemon=True)
+        self.__thread.start()
+
+    def emit(self, record: LogRecord):
+        try:
+            # args may be mutated after the call returns
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = self.__file_formatter.formatException(record.exc_info)
+                record.exc_info = None
+            self.__queue.put(record)
+        except Exception:
+            self.handleError(record)
+
+    def writer(self):
+        while True:
+            batch = [self.__queue.get()]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except Empty:
+                    break
+            stopped = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            try:
+                self.write(records)
+            except Exception as e:
+                sys.stderr.write(f"write log fail: {e}\n")
+            if stopped:
+                return
+
+    def write(self, records: list[LogRecord]):
+        if not records:
+            return
+        sys.stderr.write("".join(f"{self.__console.format(record)}\n" for record in records))
+        sys.stderr.flush()
+        for record in records:
+            self.__file.write(record.created, f"{self.__file_formatter.format(record)}\n")
+        self.__file.flush()
 
+    # logging.shutdown closes handlers at exit, drain what is queued first
+    def close(self):
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+        self.__file.close()
+        super().close()
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(RFC3339Formatter(is_file=False))
 
 root_dir = os.path.dirname(os.path.abspath(__file__))
-file_handler = logging.FileHandler(os.path.join(root_dir, "..", "logs", f'{datetime.now().strftime("%Y-%m-%d")}.log'))
-file_handler.setFormatter(RFC3339Formatter(is_file=True))
+log_handler = AsyncLogHandler(os.path.join(root_dir, "..", "logs"))
 
 logging.addLevelName(50, "CRIT")
 logging.addLevelName(40, "ERRO")
@@ -47,6 +142,5 @@ logging.addLevelName(20, "INFO")
 logging.addLevelName(10, "DEBU")
 
 logger = logging.getLogger()
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+logger.addHandler(log_handler)
 logger.setLevel(logging.INFO)
@@ -1,11 +1,12 @@
 import os
 
-from prometheus_client import start_http_server
+from prometheus_client import REGISTRY, start_http_server
 
 from agent.agent import Agent
 from config.config import Config
 from controller.grpc.server import GRPCServer
 from logger import logger
+from metrics import AgentCollector
 
 
 def prometheus():
@@ -26,9 +27,11 @@ if __name__ == "__main__":
     try:
         prometheus()
         cfg = Config.from_yaml("data/config.yaml")
-        agent = Agent()
-        agent.login(cfg.shioaji_auth, is_main=True)
-        GRPCServer(agent=agent).serve_sync(grpc_port())
+        agent = Agent(cfg.stream)
+        REGISTRY.register(AgentCollector(agent))
+        server = GRPCServer(agent=agent, cfg=cfg)
+        agent.start(cfg.shioaji_auth, is_main=True, quote_sessions=cfg.quote_sessions, on_error=server.stop)
+        server.serve_sync(grpc_port())
     except (Exception, BaseException) as e:
         if str(e) != "":
             logger.error(str(e))
@@ -0,0 +1,80 @@
+import functools
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+QUOTE_RECEIVED = Counter("titan_quote_received", "Quotes received from shioaji callbacks", ["type", "code"])
+STREAM_LATENCY = Histogram(
+    "titan_stream_latency_seconds", "Latency from callback to stream yield", ["hub"], buckets=LATENCY_BUCKETS
+)
+ACTIVE_STREAMS = Gauge("titan_active_streams", "Active streams per rpc", ["rpc"])
+ORDER_RECONCILE_SECONDS = Histogram("titan_order_reconcile_seconds", "Duration of update_local_order")
+CATALOG_BUILD_SECONDS = Histogram("titan_catalog_build_seconds", "Contract catalog build time", ["kind"])
+CATALOG_SIZE_BYTES = Gauge("titan_catalog_size_bytes", "Serialized contract catalog size", ["kind"])
+CATALOG_SERVED_BYTES = Counter("titan_catalog_served_bytes", "Contract catalog bytes sent to clients", ["kind"])
+ORDER_SUBMIT_SECONDS = Histogram(
+    "titan_order_submit_seconds", "Time spent in titan to submit an order request", ["op"], buckets=LATENCY_BUCKETS
+)
+SHIOAJI_USAGE = Gauge("titan_shioaji_usage", "Shioaji usage status", ["field"])
+
+
+# wrap an async generator rpc to count it in titan_active_streams while it is open
+def track_stream(func):
+    gauge = ACTIVE_STREAMS.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with gauge.track_inprogress():
+            async for item in func(*args, **kwargs):
+                yield item
+
+    return wrapper
+
+
+# hub depth and drop counters are read at scrape time, nothing is added on the quote path
+class AgentCollector(Collector):
+    def __init__(self, agent):
+        self.agent = agent
+
+    def collect(self):
+        code_depth = GaugeMetricFamily("titan_queue_depth", "Queued items per code", labels=["hub", "code"])
+        depth = GaugeMetricFamily(
+            "titan_subscriber_queue_depth", "Queued items per subscriber", labels=["hub", "code", "subscriber"]
+        )
+        dropped = CounterMetricFamily(
+            "titan_subscriber_dropped", "Items dropped per subscriber", labels=["hub", "code", "subscriber"]
+        )
+        conflated = CounterMetricFamily(
+            "titan_subscriber_conflated", "Items conflated per subscriber", labels=["hub", "code", "subscriber"]
+        )
+        for hub in self.agent.hubs():
+            for key, mailboxes in hub.subscribers().items():
+                code = str(key)
+                code_depth.add_metric([hub.name, code], sum(len(mailbox) for mailbox in mailboxes))
+                for mailbox in mailboxes:
+                    labels = [hub.name, code, str(mailbox.id)]
+                    depth.add_metric(labels, len(mailbox))
+                    dropped.add_metric(labels, mailbox.dropped)
+                    conflated.add_metric(labels, mailbox.conflated)
+        yield code_depth
+        yield depth
+        yield dropped
+        yield conflated
+        yield GaugeMetricFamily(
+            "titan_subscription_count", "Shioaji quote subscriptions in use", value=self.agent.subscription.count
+        )
+        yield GaugeMetricFamily(
+            "titan_subscription_capacity", "Shioaji quote subscriptions quota", value=self.agent.subscription.capacity
+        )
+        yield GaugeMetricFamily(
+            "titan_tick_store_ticks", "Intraday fop ticks held in memory", value=self.agent.tick_store.count()
+        )
+        session_count = GaugeMetricFamily(
+            "titan_session_subscription_count", "Shioaji quote subscriptions per session", labels=["session"]
+        )
+        for session, load in enumerate(self.agent.subscription.session_loads()):
+            session_count.add_metric([str(session)], load)
+        yield session_count
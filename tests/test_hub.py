@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from queue import ShutDown
+
+import pytest
+
+from agent.hub import Hub, Mailbox
+from config.stream import SlowConsumerPolicy
+
+
+def test_drop_oldest_keeps_newest():
+    mailbox = Mailbox(2)
+    for i in range(3):
+        assert mailbox.put("a", i)
+    assert mailbox.dropped == 1
+    assert [mailbox.get(), mailbox.get()] == [1, 2]
+
+
+def test_conflate_keeps_first_arrival_position():
+    mailbox = Mailbox(8)
+    mailbox.put("a", 1, SlowConsumerPolicy.CONFLATE)
+    mailbox.put("b", 1, SlowConsumerPolicy.CONFLATE)
+    mailbox.put("a", 2, SlowConsumerPolicy.CONFLATE)
+    assert mailbox.conflated == 1
+    assert len(mailbox) == 2
+    assert mailbox.get() == 2
+    assert mailbox.get() == 1
+
+
+def test_conflate_after_pop_queues_again():
+    mailbox = Mailbox(8)
+    mailbox.put("a", 1, SlowConsumerPolicy.CONFLATE)
+    assert mailbox.get() == 1
+    mailbox.put("a", 2, SlowConsumerPolicy.CONFLATE)
+    mailbox.put("a", 3, SlowConsumerPolicy.CONFLATE)
+    assert len(mailbox) == 1
+    assert mailbox.get() == 3
+
+
+def test_conflate_cell_evicted_by_drop_oldest():
+    mailbox = Mailbox(2)
+    mailbox.put("a", 1, SlowConsumerPolicy.CONFLATE)
+    mailbox.put("b", 1)
+    mailbox.put("c", 1)
+    mailbox.put("a", 2, SlowConsumerPolicy.CONFLATE)
+    assert mailbox.conflated == 0
+    assert [mailbox.get(), mailbox.get()] == [1, 2]
+
+
+def test_disconnect_closes_and_keeps_items():
+    mailbox = Mailbox(2)
+    assert mailbox.put("a", 1, SlowConsumerPolicy.DISCONNECT)
+    assert mailbox.put("a", 2, SlowConsumerPolicy.DISCONNECT)
+    assert not mailbox.put("a", 3, SlowConsumerPolicy.DISCONNECT)
+    assert mailbox.closed
+    assert len(mailbox) == 2
+    with pytest.raises(ShutDown):
+        mailbox.get()
+
+
+def test_close_clears_items():
+    mailbox = Mailbox(2)
+    mailbox.put("a", 1)
+    mailbox.close()
+    assert len(mailbox) == 0
+    assert not mailbox.put("a", 2)
+    with pytest.raises(ShutDown):
+        mailbox.get()
+
+
+def test_disconnect_wakes_async_consumer():
+    async def run():
+        mailbox = Mailbox(1)
+        mailbox.put("a", 1, SlowConsumerPolicy.DISCONNECT)
+        assert await mailbox.aget() == 1
+        waiting = asyncio.ensure_future(mailbox.aget())
+        await asyncio.sleep(0)
+        publisher = threading.Thread(
+            target=lambda: [mailbox.put("a", i, SlowConsumerPolicy.DISCONNECT) for i in range(2)]
+        )
+        publisher.start()
+        publisher.join()
+        with pytest.raises(ShutDown):
+            await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(run())
+
+
+def test_get_batch_stops_at_size():
+    mailbox = Mailbox(8)
+    for i in range(5):
+        mailbox.put("a", i)
+    assert mailbox.get_batch(3, 0) == [0, 1, 2]
+    assert mailbox.get_batch(3, 0) == [3, 4]
+
+
+def test_hub_unsubscribes_disconnected_mailbox():
+    hub = Hub("tick")
+    slow, fast = Mailbox(1), Mailbox(8)
+    hub.subscribe("TXF", slow, SlowConsumerPolicy.DISCONNECT)
+    hub.subscribe("TXF", fast)
+    hub.publish("TXF", 1)
+    hub.publish("TXF", 2)
+    assert slow.closed
+    assert hub.subscriber_count("TXF") == 1
+    assert [fast.get(), fast.get()] == [1, 2]
+
+
+def test_hub_removes_key_with_last_mailbox():
+    hub = Hub("tick")
+    mailbox = Mailbox(1)
+    hub.subscribe("TXF", mailbox)
+    assert hub.unsubscribe("TXF", mailbox) == 0
+    assert hub.keys() == []
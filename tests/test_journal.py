@@ -0,0 +1,159 @@
+import os
+import time
+from datetime import datetime
+
+import msgpack
+import pytest
+
+from agent import journal
+from agent.journal import KIND_BIDASK, KIND_TICK, Journal, JournalReader, journal_path
+from agent.record import JournalBidAsk, JournalTick
+from agent.snapshot import trading_date
+
+
+def tick(code: str, volume: int) -> JournalTick:
+    return JournalTick(
+        code, datetime(2026, 10, 16, 9, 0, volume), 100.0, 100.5, 100.1, 101.0, 102.0, 99.0,
+        101.0, 1010.0, 1.0, 1.0, 3, 4, volume, volume * 10, 1, 2, False,
+    )  # fmt: skip
+
+
+def bidask(code: str) -> JournalBidAsk:
+    return JournalBidAsk(
+        code, datetime(2026, 10, 16, 9, 0, 0), 10, 20,
+        [100.0, 99.0, 98.0, 97.0, 96.0], [1, 2, 3, 4, 5], [0, 0, 0, 0, 0],
+        [101.0, 102.0, 103.0, 104.0, 105.0], [5, 4, 3, 2, 1], [0, 0, 0, 0, 0],
+        0.0, 0.0, 100.5, 0, 0, False,
+    )  # fmt: skip
+
+
+def paths(directory) -> tuple[str, str]:
+    return journal_path(str(directory), trading_date())
+
+
+def chunks(index_path: str) -> list[dict]:
+    with open(index_path, "rb") as file:
+        return list(msgpack.Unpacker(file, strict_map_key=False))
+
+
+def drain(writer: Journal, directory, size: int):
+    data_path, _ = paths(directory)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if os.path.exists(data_path) and JournalReader(str(directory), trading_date()).size >= size:
+            return
+        time.sleep(0.01)
+    raise TimeoutError
+
+
+def volumes(reader: JournalReader, code: str) -> list[int]:
+    return [record.volume for record in reader.records(KIND_TICK, code)]
+
+
+def test_reader_uses_index(tmp_path):
+    writer = Journal(str(tmp_path))
+    writer.start()
+    for volume in range(1, 4):
+        writer.append(KIND_TICK, tick("TXFR1", volume))
+    writer.append(KIND_BIDASK, bidask("TXFR1"))
+    writer.stop()
+    data_path, index_path = paths(tmp_path)
+    (chunk,) = chunks(index_path)[1:]
+    assert chunk["size"] == os.path.getsize(data_path)
+    reader = JournalReader(str(tmp_path), trading_date())
+    assert reader.codes == ["TXFR1"]
+    assert volumes(reader, "TXFR1") == [1, 2, 3]
+    assert next(reader.records(KIND_BIDASK, "TXFR1")) == bidask("TXFR1")
+
+
+def test_index_appends_only_new_offsets(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "INDEX_FLUSH_INTERVAL", 0)
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 1))
+    drain(writer, tmp_path, 1)
+    data_path, index_path = paths(tmp_path)
+    first = os.path.getsize(data_path)
+    writer.append(KIND_TICK, tick("MXFR1", 2))
+    writer.append(KIND_TICK, tick("TXFR1", 3))
+    writer.stop()
+    flushed = chunks(index_path)[1:]
+    assert len(flushed) == 2
+    assert flushed[0]["size"] == first and flushed[0]["codes"] == ["TXFR1"]
+    assert flushed[1]["code_start"] == 1 and flushed[1]["codes"] == ["MXFR1"]
+    assert sorted(flushed[1]["index"][KIND_TICK]) == ["MXFR1", "TXFR1"]
+    reader = JournalReader(str(tmp_path), trading_date())
+    assert reader.codes == ["TXFR1", "MXFR1"]
+    assert volumes(reader, "TXFR1") == [1, 3]
+    assert volumes(reader, "MXFR1") == [2]
+
+
+def test_crash_mid_flush_leaves_readable_index(tmp_path):
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 1))
+    writer.stop()
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 2))
+    writer.append(KIND_TICK, tick("MXFR1", 3))
+    writer.stop()
+    data_path, index_path = paths(tmp_path)
+    last = len(msgpack.packb(chunks(index_path)[-1]))
+    os.truncate(index_path, os.path.getsize(index_path) - last // 2)
+    reader = JournalReader(str(tmp_path), trading_date())
+    assert reader.size == os.path.getsize(data_path)
+    assert reader.codes == ["TXFR1", "MXFR1"]
+    assert volumes(reader, "TXFR1") == [1, 2]
+    assert volumes(reader, "MXFR1") == [3]
+
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 4))
+    writer.stop()
+    assert [chunk["code_start"] for chunk in chunks(index_path)] == [0, 2]
+    assert volumes(JournalReader(str(tmp_path), trading_date()), "TXFR1") == [1, 2, 4]
+
+
+def test_index_past_journal_end_is_ignored(tmp_path):
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 1))
+    writer.append(KIND_TICK, tick("TXFR1", 2))
+    writer.stop()
+    data_path, _ = paths(tmp_path)
+    size = os.path.getsize(data_path)
+    os.truncate(data_path, size - 1)
+    reader = JournalReader(str(tmp_path), trading_date())
+    assert volumes(reader, "TXFR1") == [1]
+    assert reader.size < size - 1
+
+
+def test_partial_record_is_truncated_on_reopen(tmp_path):
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 1))
+    writer.stop()
+    data_path, _ = paths(tmp_path)
+    with open(data_path, "ab") as file:
+        file.write(b"\x01\x00\x00")
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 2))
+    writer.stop()
+    reader = JournalReader(str(tmp_path), trading_date())
+    assert reader.size == os.path.getsize(data_path)
+    assert volumes(reader, "TXFR1") == [1, 2]
+
+
+@pytest.mark.parametrize("garbage", [b"\xc1", msgpack.packb({"size": 1}), msgpack.packb([1, 2])])
+def test_corrupt_chunk_falls_back_to_scan(tmp_path, garbage):
+    writer = Journal(str(tmp_path))
+    writer.start()
+    writer.append(KIND_TICK, tick("TXFR1", 1))
+    writer.stop()
+    _, index_path = paths(tmp_path)
+    with open(index_path, "wb") as file:
+        file.write(garbage)
+    reader = JournalReader(str(tmp_path), trading_date())
+    assert volumes(reader, "TXFR1") == [1]
@@ -0,0 +1,153 @@
+from dataclasses import replace
+from types import SimpleNamespace
+
+import shioaji.constant as sc
+
+from agent.order_book import EVENT_DEAL, EVENT_ORDER, EVENT_RECONCILE, OrderBook, OrderRecord
+
+
+def new_order(order_id: str, quantity: int = 2, custom_field: str = "") -> dict:
+    return {
+        "operation": {"op_type": "New", "op_code": "00"},
+        "order": {
+            "id": order_id,
+            "seqno": "000001",
+            "ordno": "A0001",
+            "action": "Buy",
+            "price": 100.0,
+            "quantity": quantity,
+            "custom_field": custom_field,
+        },
+        "status": {},
+        "contract": {"code": "TXFR1", "security_type": "FUT"},
+    }
+
+
+def deal(order_id: str, seq: str, quantity: int = 1) -> dict:
+    return {"trade_id": order_id, "seqno": seq, "exchange_seq": seq, "price": 100.0, "quantity": quantity, "ts": 1.0}
+
+
+def trade(order_id: str, status: sc.Status, deal_quantity: int = 0, quantity: int = 2):
+    return SimpleNamespace(
+        order=SimpleNamespace(
+            id=order_id,
+            seqno="000001",
+            ordno="A0001",
+            action=sc.Action.Buy,
+            price=100.0,
+            quantity=quantity,
+            custom_field="",
+        ),
+        contract=SimpleNamespace(code="TXFR1", security_type=sc.SecurityType.Future),
+        status=SimpleNamespace(
+            status=status,
+            modified_price=0,
+            deal_quantity=deal_quantity,
+            cancel_quantity=0,
+            deals=[],
+        ),
+    )
+
+
+def test_apply_order_and_deals():
+    events = []
+    book = OrderBook(on_event=events.append)
+    assert book.apply(sc.OrderState.FuturesOrder, new_order("a"))
+    assert book.apply(sc.OrderState.FuturesDeal, deal("a", "1"))
+    assert book.apply(sc.OrderState.FuturesDeal, deal("a", "1"))
+    assert book.apply(sc.OrderState.FuturesDeal, deal("a", "2"))
+    assert [event.kind for event in events] == [EVENT_ORDER, EVENT_DEAL, EVENT_DEAL]
+    record = book.get("a")
+    assert record is not None
+    assert record.deal_quantity == 2
+    assert record.status == sc.Status.Filled.value
+
+
+def test_deal_for_unknown_order_needs_reconcile():
+    book = OrderBook()
+    assert not book.apply(sc.OrderState.FuturesDeal, deal("a", "1"))
+
+
+def test_reconcile_keeps_callbacks_applied_during_fetch():
+    book = OrderBook()
+    book.apply(sc.OrderState.FuturesOrder, new_order("a"))
+    since_seq = book.seq
+    fetched = [trade("a", sc.Status.Submitted)]
+    book.apply(sc.OrderState.FuturesDeal, deal("a", "1"))
+    book.reconcile(fetched, since_seq)
+    record = book.get("a")
+    assert record is not None
+    assert record.deal_quantity == 1
+
+
+def test_reconcile_replaces_stale_records():
+    events = []
+    book = OrderBook(on_event=events.append)
+    book.apply(sc.OrderState.FuturesOrder, new_order("a"))
+    events.clear()
+    book.reconcile([trade("a", sc.Status.Filled, deal_quantity=2)], book.seq)
+    record = book.get("a")
+    assert record is not None
+    assert record.status == sc.Status.Filled.value
+    assert [event.kind for event in events] == [EVENT_RECONCILE]
+
+
+def test_reconcile_drops_local_only_orders_unless_changed_during_fetch():
+    book = OrderBook()
+    book.apply(sc.OrderState.FuturesOrder, new_order("gone"))
+    since_seq = book.seq
+    book.apply(sc.OrderState.FuturesOrder, new_order("new"))
+    book.reconcile([], since_seq)
+    assert book.get("gone") is None
+    assert book.get("new") is not None
+
+
+def test_resume_with_deltas_in_history():
+    book = OrderBook()
+    book.apply(sc.OrderState.FuturesOrder, new_order("a"))
+    last_seq = book.seq
+    book.apply(sc.OrderState.FuturesDeal, deal("a", "1"))
+    seq, events, is_snapshot = book.resume(last_seq, book.epoch)
+    assert not is_snapshot
+    assert seq == book.seq
+    assert [event.kind for event in events] == [EVENT_DEAL]
+
+
+def test_resume_from_another_epoch_gets_snapshot():
+    book = OrderBook()
+    book.apply(sc.OrderState.FuturesOrder, new_order("a"))
+    seq, events, is_snapshot = book.resume(book.seq, "previous")
+    assert is_snapshot
+    assert [event.record.id for event in events] == ["a"]
+    assert all(event.seq == seq for event in events)
+
+
+def test_resume_past_history_gets_snapshot():
+    book = OrderBook(history_size=2)
+    for order_id in "abcd":
+        book.apply(sc.OrderState.FuturesOrder, new_order(order_id))
+    _, events, is_snapshot = book.resume(2, book.epoch)
+    assert not is_snapshot
+    assert [event.record.id for event in events] == ["c", "d"]
+    _, events, is_snapshot = book.resume(1, book.epoch)
+    assert is_snapshot
+    assert len(events) == 4
+
+
+def test_resume_at_head_gets_nothing():
+    book = OrderBook()
+    book.apply(sc.OrderState.FuturesOrder, new_order("a"))
+    _, events, is_snapshot = book.resume(book.seq, book.epoch)
+    assert not is_snapshot
+    assert events == []
+
+
+def test_reject_without_order_id_is_keyed_by_client_order_id():
+    book = OrderBook()
+    rejected = OrderRecord.from_trade(trade("", sc.Status.Failed))
+    book.reject(rejected)
+    assert book.get_all() == []
+    book.reject(replace(rejected, client_order_id="ab0001"))
+    record = book.get("ab0001")
+    assert record is not None
+    assert record.status == sc.Status.Failed.value
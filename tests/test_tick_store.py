@@ -0,0 +1,57 @@
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from agent.record import datetime_to_ns, decode_tick, encode_tick
+from agent.tick_store import TickStore
+
+
+def tick(second: int, close: str = "100.5", simtrade: bool = False) -> SimpleNamespace:
+    return SimpleNamespace(
+        code="TXFR1",
+        datetime=datetime(2026, 10, 16, 9, 0, second),
+        open=Decimal("100.3"),
+        underlying_price=Decimal("22000.12"),
+        avg_price=Decimal("100.37"),
+        close=Decimal(close),
+        high=Decimal("101"),
+        low=Decimal("99.1"),
+        amount=Decimal("201.1"),
+        total_amount=Decimal("1003.7"),
+        price_chg=Decimal("0.3"),
+        pct_chg=Decimal("0.29"),
+        bid_side_total_vol=7,
+        ask_side_total_vol=9,
+        volume=2,
+        total_volume=10,
+        tick_type=1,
+        chg_type=2,
+        simtrade=simtrade,
+    )
+
+
+def rows(store: TickStore, since_ns: int = 0) -> list:
+    date, start, end = store.bounds("TXFR1", since_ns)
+    return list(store.rows(date, "TXFR1", start, end))
+
+
+def test_history_rows_match_live_records():
+    store = TickStore()
+    live = tick(1)
+    store.append(live)
+    assert rows(store) == [decode_tick("TXFR1", encode_tick(live), 0)]
+
+
+def test_simulated_ticks_are_not_stored():
+    store = TickStore()
+    store.append(tick(1, simtrade=True))
+    store.append(tick(2))
+    assert [row.datetime.second for row in rows(store)] == [2]
+
+
+def test_bounds_since():
+    store = TickStore()
+    for second in range(3):
+        store.append(tick(second, close=f"10{second}"))
+    since = datetime_to_ns(rows(store)[1].datetime)
+    assert [row.close for row in rows(store, since)] == [101.0, 102.0]